@@ -0,0 +1,116 @@
+"""
+On-disk store of precomputed response bodies.
+
+Artifacts are written by precompute_artifacts.py and live under
+precompute/artifacts/<dataset version>-<source version>/<endpoint>/<params hash>.<ext>,
+where the dataset version is the content hash of merged_df.csv and the source
+version a hash of the modules that compute and render responses and of the
+settings that shape them (also part of every ETag, see httpcache.py). A lookup only matches artifacts built from the
+current file by the current code, so a changed dataset or a deploy falls back
+to live computation until the batch job is rerun.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import metrics
+from datastore import BASE_DIR, file_version
+from responses import COLUMNAR_MEDIA_TYPE
+from services import MERGED_DF_PATH, response_settings
+
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(BASE_DIR, "precompute", "artifacts"))
+
+# Endpoints whose responses depend only on merged_df.csv and their parameters
+ARTIFACT_ENDPOINTS = ("eigenValues", "biplot", "top_features", "pca_loadings", "kmeans", "scatterplot_matrix", "mdp")
+
+_EXTENSIONS = {COLUMNAR_MEDIA_TYPE: "col"}
+
+# Modules that decide what a response contains; a deploy that changes them
+# (or the settings in services.response_settings) must not serve or
+# revalidate against bodies rendered by the old code
+_SOURCE_FILES = (
+    "services.py", "views.py", "responses.py", "geo.py", "outofcore.py", "datastore.py", "matrixcache.py"
+)
+
+
+def _source_version():
+    digest = hashlib.sha256()
+    for name in _SOURCE_FILES:
+        with open(os.path.join(BASE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(response_settings(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+SOURCE_VERSION = _source_version()
+
+
+def dataset_version():
+    """Returns the content hash of merged_df.csv, or None if it is missing."""
+    try:
+        return file_version(MERGED_DF_PATH)
+    except FileNotFoundError:
+        return None
+
+
+def params_key(params, media_type):
+    """Stable hash of normalized request parameters and media type."""
+    canonical = json.dumps({"params": params, "media": media_type}, sort_keys=True, default=list)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _version_dir(version):
+    return f"{version}-{SOURCE_VERSION}"
+
+
+def artifact_path(version, endpoint, params, media_type):
+    extension = _EXTENSIONS.get(media_type, "json")
+    return os.path.join(ARTIFACT_DIR, _version_dir(version), endpoint, f"{params_key(params, media_type)}.{extension}")
+
+
+def load_artifact(endpoint, params, media_type):
+    """
+    Returns the precomputed body for a request, or None when no artifact was
+    built for these parameters from the current dataset by the current code.
+    """
+    if endpoint not in ARTIFACT_ENDPOINTS:
+        return None
+    version = dataset_version()
+    if version is None:
+        return None
+    try:
+        with open(artifact_path(version, endpoint, params, media_type), "rb") as f:
+            body = f.read()
+    except FileNotFoundError:
+        metrics.count("artifact", False)
+        return None
+    metrics.count("artifact", True)
+    return body
+
+
+def save_artifact(version, endpoint, params, media_type, body):
+    """Writes an artifact atomically and returns its path."""
+    path = artifact_path(version, endpoint, params, media_type)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return path
+
+
+def prune(keep_version):
+    """
+    Removes artifacts built from any dataset version other than keep_version
+    or by code other than the current source version.
+    """
+    if not os.path.isdir(ARTIFACT_DIR):
+        return []
+    keep = _version_dir(keep_version)
+    removed = []
+    for name in os.listdir(ARTIFACT_DIR):
+        if name != keep:
+            shutil.rmtree(os.path.join(ARTIFACT_DIR, name), ignore_errors=True)
+            removed.append(name)
+    return removed
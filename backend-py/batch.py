@@ -0,0 +1,174 @@
+"""
+Batched dashboard views computed as one dependency graph.
+
+POST /batch takes a list of view specs and runs them in a single compute task.
+The intermediates the views share (standardized matrix, PCA fit, top
+features, cluster labels, MDS coordinates, optimal k) are nodes of a graph:
+each is computed once, as soon as the nodes it depends on are ready, and
+every view starts as soon as its own intermediates are. Nodes and views run on
+BATCH_THREADS threads of one worker, so independent work (the data MDS next to
+the KMeans elbow, say) overlaps and a cold batch takes about as long as its
+slowest view rather than the sum of all of them.
+
+Each view is rendered as one NDJSON line the moment it finishes:
+
+    {"type": "view", "id": ..., "view": "kmeans", "data": {...}}
+    {"type": "error", "id": ..., "view": "kmeans", "status": 422, "error": "..."}
+
+Errors carry the status and detail the view's own endpoint would respond
+with (see views.error_status), so unexpected failures are reported as a
+generic 500. A view whose intermediate failed gets the intermediate's error;
+the other views are unaffected. View parameters are range-checked by the
+services the views call, against the same bounds the routes declare.
+
+Configuration (environment variables):
+    ANALYTICS_BATCH_THREADS     threads computing one batch (default: 4)
+    ANALYTICS_BATCH_MAX_VIEWS   views accepted per batch (default: 32)
+"""
+import inspect
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import services
+import views
+from responses import NDJSON_MEDIA_TYPE, render
+
+BATCH_THREADS = int(os.environ.get("ANALYTICS_BATCH_THREADS", "4"))
+BATCH_MAX_VIEWS = int(os.environ.get("ANALYTICS_BATCH_MAX_VIEWS", "32"))
+
+
+def _mdp_needs(params):
+    mds = ("mds", params["method"], params["landmarks"])
+    if params["find_optimal"]:
+        return [("optimal_k",) + mds[1:] + (params["silhouette_sample"],)]
+    return [mds, ("cluster_labels", params["clusters"], 2)]
+
+
+# View name -> (view function, intermediates it needs given its full parameters)
+VIEWS = {
+    "eigenValues": (views.eigen_values_view, lambda params: [("pca",)]),
+    "biplot": (views.biplot_view, lambda params: [("pca",)]),
+    "top_features": (views.top_features_view, lambda params: [("top_features", params["dimensions"])]),
+    "pca_loadings": (views.pca_loadings_view, lambda params: [("pca",)]),
+    "scatterplot_matrix": (views.scatterplot_matrix_view, lambda params: [("top_features", params["dimensions"])]),
+    "kmeans": (views.kmeans_view, lambda params: [("elbow", params["dimensions"])]),
+    "mdp": (views.mdp_view, _mdp_needs),
+    "pdp": (views.pdp_view, lambda params: [("standardized",)]),
+    "crime_data": (views.crime_data_view, lambda params: []),
+    "sunburst_data": (views.sunburst_data_view, lambda params: [])
+}
+
+# Intermediate kind -> (dependencies, computation) of a node key; the
+# computations are the memoized service calls the views make themselves
+_NODES = {
+    "standardized": (lambda key: [], lambda key: services.load_merged_dataset()),
+    "pca": (lambda key: [("standardized",)], lambda key: services.get_pca_model()),
+    "top_features": (lambda key: [("pca",)], lambda key: services.top_features(key[1])),
+    "elbow": (lambda key: [("pca",)], lambda key: services.get_elbow_models(key[1])),
+    "cluster_labels": (lambda key: [("pca",)], lambda key: services.get_cluster_labels(key[1], key[2])),
+    "mds": (lambda key: [("standardized",)], lambda key: services.get_data_mds(key[1], key[2])),
+    "optimal_k": (lambda key: [("mds", key[1], key[2])], lambda key: services.find_optimal_clusters(key[1], key[2], key[3]))
+}
+
+
+def plan(specs):
+    """
+    Validates view specs ({"view": name, "params": {...}, "id": optional})
+    and returns them with their full parameters and needed intermediates.
+
+    Raises:
+        ValueError: for an unknown view, unknown parameters or too many views
+    """
+    if len(specs) > BATCH_MAX_VIEWS:
+        raise ValueError(f"At most {BATCH_MAX_VIEWS} views per batch")
+    planned = []
+    for spec in specs:
+        name = spec.get("view")
+        if name not in VIEWS:
+            raise ValueError(f"Unknown view '{name}', expected one of {sorted(VIEWS)}")
+        view, needs = VIEWS[name]
+        try:
+            bound = inspect.signature(view).bind(**(spec.get("params") or {}))
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for view '{name}': {e}")
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        planned.append({"id": spec.get("id") or name, "view": name, "params": params, "needs": needs(params)})
+    return planned
+
+
+def _add_node(graph, key):
+    # Adds an intermediate and everything it depends on to the graph
+    if key in graph:
+        return
+    dependencies, compute = _NODES[key[0]]
+    for dependency in dependencies(key):
+        _add_node(graph, dependency)
+    graph[key] = (dependencies(key), lambda: compute(key))
+
+
+def _line(spec, **fields):
+    return render(dict({"id": spec["id"], "view": spec["view"]}, **fields), NDJSON_MEDIA_TYPE)
+
+
+def _error_line(spec, error):
+    status, detail = views.error_status(error)
+    if status == 500:
+        print(f"Batch view {spec['view']} failed: {error!r}")
+    return _line(spec, type="error", status=status, error=detail)
+
+
+def _run_view(spec, sink):
+    # View failures are reported in their own line and never fail the batch
+    view = VIEWS[spec["view"]][0]
+    try:
+        data = view(**spec["params"])
+    except Exception as e:
+        sink.put(_error_line(spec, e))
+        return
+    sink.put(_line(spec, type="view", data=data))
+
+
+def run(sink, specs):
+    """
+    Computes the planned views (see plan), putting each rendered line on
+    sink as soon as it is ready and None once every view is done. Meant to be
+    run on the compute executor through executor.stream().
+    """
+    try:
+        graph = {}
+        for index, spec in enumerate(specs):
+            for key in spec["needs"]:
+                _add_node(graph, key)
+            graph[("view", index)] = (spec["needs"], lambda spec=spec: _run_view(spec, sink))
+
+        waiting = {key: set(dependencies) for key, (dependencies, _) in graph.items()}
+        failed = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=BATCH_THREADS, thread_name_prefix="analytics-batch") as pool:
+            while waiting or running:
+                for key in [key for key, pending in waiting.items() if not pending]:
+                    del waiting[key]
+                    error = next((failed[dependency] for dependency in graph[key][0] if dependency in failed), None)
+                    if error is None:
+                        running[pool.submit(metrics.bind(graph[key][1]))] = key
+                        continue
+                    # Skip everything downstream of a failed intermediate
+                    failed[key] = error
+                    if key[0] == "view":
+                        sink.put(_error_line(specs[key[1]], error))
+                    for pending in waiting.values():
+                        pending.discard(key)
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    if future.exception() is not None:
+                        failed[key] = future.exception()
+                    for pending in waiting.values():
+                        pending.discard(key)
+    finally:
+        sink.put(None)
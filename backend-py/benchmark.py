@@ -0,0 +1,364 @@
+"""
+Reproducible benchmarks for the analytics services and API endpoints.
+
+Generates a synthetic merged_df.csv for each requested size (the other data
+files are linked from data/), points the backend at it through
+ANALYTICS_DATA_DIR and measures:
+
+    services    every service function called directly: cold latency (fresh
+                dataset store, so parsing and fitting are included), warm
+                latency (memoized), peak traced memory of a cold call and the
+                JSON payload size
+    endpoints   every endpoint through an in-process test client: cold and
+                warm latency, 304 revalidation latency, peak traced memory and
+                the identity/gzip body sizes
+    coldstart   a fresh interpreter serving its first requests: time from
+                process start to the app import, app startup and each first
+                response, once with empty caches ("fit") and once restoring
+                the matrix cache and model snapshots the first runs left
+                ("restored"). Heavy views run in --cold-start-workers
+                prewarmed worker processes, as in the server.
+
+Latencies are reported as min/mean/p50/p90/p99 in milliseconds over
+--repeat runs. Results are written as JSON; --baseline compares them with an
+earlier run and exits with status 1 when a p50 regresses by more than
+--tolerance (and at least --min-delta-ms).
+
+Usage:
+    python benchmark.py [--rows 1000,10000,100000] [--numeric 12]
+                        [--categorical 2] [--nan-fraction 0.05]
+                        [--repeat 5] [--only services|endpoints|coldstart]
+                        [--cold-start-workers N]
+                        [--output bench.json] [--baseline old.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DATA_DIR = os.path.join(BASE_DIR, "data")
+LINKED_FILES = ("sunburst_df.csv", "nyc_crime_by_hour.csv", "NTA.geo.json", "borough.geo.json")
+POSITIONS = ("PG", "SG", "SF", "PF", "C")
+
+
+def generate_merged_df(rows, numeric=12, categorical=2, nan_fraction=0.05, clusters=4, seed=0):
+    """
+    Synthetic merged_df: Name and POS columns, `numeric` correlated numeric
+    features drawn around `clusters` centers, one integer feature, one numeric
+    column and `categorical` text columns with nan_fraction missing values.
+    Same arguments, same frame.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 3, (clusters, numeric))
+    labels = rng.integers(0, clusters, rows)
+    # Mix the features so that PCA has structure to find
+    mixing = np.eye(numeric) + rng.normal(0, 0.3, (numeric, numeric))
+    features = (centers[labels] + rng.normal(0, 1, (rows, numeric))) @ mixing
+
+    columns = {
+        "Name": [f"P{i}" for i in range(rows)],
+        "POS": rng.choice(POSITIONS, rows)
+    }
+    for i in range(numeric):
+        columns[f"f{i}"] = features[:, i]
+    columns["g_int"] = rng.integers(0, 20, rows)
+
+    with_nan = rng.normal(0, 1, rows)
+    with_nan[rng.random(rows) < nan_fraction] = np.nan
+    columns["with_nan"] = with_nan
+    for i in range(categorical):
+        values = rng.choice([f"c{i}_{j}" for j in range(5 + 3 * i)], rows).astype(object)
+        values[rng.random(rows) < nan_fraction] = None
+        columns[f"cat{i}"] = values
+    return pd.DataFrame(columns)
+
+
+def prepare_data_dir(directory, rows, args):
+    generate_merged_df(rows, args.numeric, args.categorical, args.nan_fraction).to_csv(
+        os.path.join(directory, "merged_df.csv"), index=False
+    )
+    for name in LINKED_FILES:
+        source = os.path.join(SOURCE_DATA_DIR, name)
+        target = os.path.join(directory, name)
+        if os.path.exists(source) and not os.path.exists(target):
+            os.symlink(source, target)
+
+
+def summarize(samples):
+    samples_ms = np.asarray(samples) * 1000
+    return {
+        "min": float(samples_ms.min()),
+        "mean": float(samples_ms.mean()),
+        "p50": float(np.percentile(samples_ms, 50)),
+        "p90": float(np.percentile(samples_ms, 90)),
+        "p99": float(np.percentile(samples_ms, 99)),
+        "runs": len(samples_ms)
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def traced_peak(fn):
+    """Peak memory (bytes) allocated through Python/NumPy while fn runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def reset_caches():
+    # Drop every loaded dataset, memoized fit and cached response body
+    import datastore
+    import httpcache
+    datastore.clear()
+    with httpcache._bodies_lock:
+        httpcache._bodies.clear()
+
+
+def service_cases():
+    import services
+    return [
+        ("load_merged_dataset", services.load_merged_dataset),
+        ("perform_pca", services.perform_pca),
+        ("get_biplot_data", lambda: services.get_biplot_data(None)),
+        ("perform_kmeans", lambda: services.perform_kmeans(3, 2)),
+        ("compute_mds_json", lambda: services.compute_mds_json(cluster_labels=None, find_optimal=True)),
+        ("compute_parallel_coordinates_json", services.compute_parallel_coordinates_json),
+        ("get_sunburst_data", services.get_sunburst_data),
+        ("get_crime_data_by_hour", services.get_crime_data_by_hour),
+        ("get_nta_geojson", services.get_nta_geojson)
+    ]
+
+
+ENDPOINTS = (
+    "/eigenValues", "/biplot", "/top_features", "/scatterplot_matrix", "/pca_loadings", "/kmeans",
+    "/mdp", "/pdp", "/crime_data", "/sunburst_data", "/nta_geo"
+)
+
+
+def bench_services(rows, repeat):
+    from responses import dumps
+    results = []
+    for name, fn in service_cases():
+        cold, warm = [], []
+        for _ in range(repeat):
+            reset_caches()
+            elapsed, result = timed(fn)
+            cold.append(elapsed)
+            warm.append(timed(fn)[0])
+        reset_caches()
+        payload = len(dumps(result)) if name != "load_merged_dataset" else None
+        results.append({
+            "kind": "service",
+            "name": name,
+            "rows": rows,
+            "coldMs": summarize(cold),
+            "warmMs": summarize(warm),
+            "peakBytes": traced_peak(fn),
+            "payloadBytes": payload
+        })
+        print(f"  {name:36s} cold p50 {results[-1]['coldMs']['p50']:9.1f} ms  warm p50 {results[-1]['warmMs']['p50']:8.2f} ms")
+    return results
+
+
+def bench_endpoints(rows, repeat):
+    from fastapi.testclient import TestClient
+    import main
+
+    results = []
+    with TestClient(main.app) as client:
+        for url in ENDPOINTS:
+            cold, warm, revalidate = [], [], []
+            for _ in range(repeat):
+                reset_caches()
+                elapsed, response = timed(lambda: client.get(url, headers={"Accept-Encoding": "identity"}))
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}: {response.text[:200]}")
+                cold.append(elapsed)
+                warm.append(timed(lambda: client.get(url, headers={"Accept-Encoding": "identity"}))[0])
+                etag = response.headers.get("etag")
+                revalidate.append(timed(lambda: client.get(url, headers={"If-None-Match": etag}))[0])
+            gzip_response = client.get(url, headers={"Accept-Encoding": "gzip"})
+            reset_caches()
+            results.append({
+                "kind": "endpoint",
+                "name": url,
+                "rows": rows,
+                "coldMs": summarize(cold),
+                "warmMs": summarize(warm),
+                "revalidateMs": summarize(revalidate),
+                "peakBytes": traced_peak(lambda: client.get(url)),
+                "payloadBytes": len(response.content),
+                "gzipBytes": int(gzip_response.headers.get("content-length", len(gzip_response.content)))
+            })
+            print(f"  {url:36s} cold p50 {results[-1]['coldMs']['p50']:9.1f} ms  warm p50 {results[-1]['warmMs']['p50']:8.2f} ms")
+    return results
+
+
+COLD_START_URLS = ("/eigenValues", "/kmeans", "/mdp")
+
+
+def probe_cold_start():
+    # Runs in the fresh interpreter started by bench_cold_start; times are
+    # measured from when the parent started this process
+    started = float(os.environ["BENCH_SPAWNED_AT"])
+    from fastapi.testclient import TestClient
+    import main
+
+    timings = {"import": time.time() - started}
+    with TestClient(main.app) as client:
+        timings["startup"] = time.time() - started
+        for url in COLD_START_URLS:
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}: {response.text[:200]}")
+            timings[url] = time.time() - started
+    print(json.dumps(timings))
+
+
+def bench_cold_start(rows, repeat, data_dir, workers):
+    cache_dirs = (os.path.join(data_dir, "matrix"), os.path.join(data_dir, "snapshots"))
+    # The other parts run in-process without workers; the server prewarms them
+    env = dict(
+        os.environ, ANALYTICS_MATRIX_CACHE="on", MATRIX_CACHE_DIR=cache_dirs[0],
+        ANALYTICS_SNAPSHOTS="on", ANALYTICS_SNAPSHOT_DIR=cache_dirs[1],
+        ANALYTICS_PROCESS_WORKERS=str(workers)
+    )
+    results = []
+    # The "fit" runs start without caches; the last one leaves them for the "restored" runs
+    for phase in ("fit", "restored"):
+        samples = {}
+        for _ in range(repeat):
+            if phase == "fit":
+                for directory in cache_dirs:
+                    shutil.rmtree(directory, ignore_errors=True)
+            env["BENCH_SPAWNED_AT"] = repr(time.time())
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--probe-cold-start"],
+                env=env, capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(f"Cold-start probe failed:\n{completed.stderr[-2000:]}")
+            # The app prints its own log lines before the timings
+            for milestone, seconds in json.loads(completed.stdout.strip().splitlines()[-1]).items():
+                samples.setdefault(milestone, []).append(seconds)
+        for milestone, seconds in samples.items():
+            results.append({"kind": "coldstart", "name": f"{phase} {milestone}", "rows": rows, "coldMs": summarize(seconds)})
+            print(f"  {phase + ' ' + milestone:36s} p50 {results[-1]['coldMs']['p50']:9.1f} ms")
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    Prints p50 changes against a baseline run and returns the regressions:
+    slowdowns above tolerance (relative) and min_delta_ms (absolute, so
+    sub-millisecond noise is not reported).
+    """
+    previous = {(r["kind"], r["name"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["kind"], result["name"], result["rows"]))
+        if old is None:
+            continue
+        for metric in ("coldMs", "warmMs"):
+            if metric not in result or metric not in old:
+                continue
+            before, after = old[metric]["p50"], result[metric]["p50"]
+            change = (after - before) / before if before else 0.0
+            flag = "REGRESSION" if change > tolerance and after - before > min_delta_ms else ""
+            print(f"{result['kind']:8s} {result['name']:36s} {result['rows']:>7d} {metric:7s} {before:9.2f} -> {after:9.2f} ms ({change:+.0%}) {flag}")
+            if flag:
+                regressions.append((result["name"], result["rows"], metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics services and endpoints")
+    parser.add_argument("--rows", default="1000,10000,100000", help="Comma-separated merged_df sizes")
+    parser.add_argument("--numeric", type=int, default=12, help="Numeric feature columns")
+    parser.add_argument("--categorical", type=int, default=2, help="Categorical columns")
+    parser.add_argument("--nan-fraction", type=float, default=0.05, help="Missing values in the NaN-bearing columns")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--only", choices=("services", "endpoints", "coldstart"), help="Run one part of the suite")
+    parser.add_argument(
+        "--cold-start-workers", type=int, default=min(4, os.cpu_count() or 1),
+        help="Worker processes in the cold-start runs (default: the server's, min(4, CPUs))"
+    )
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative p50 slowdown reported as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Smallest absolute p50 slowdown reported as a regression")
+    parser.add_argument("--probe-cold-start", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.probe_cold_start:
+        probe_cold_start()
+        return
+
+    sizes = [int(size) for size in args.rows.split(",")]
+    data_dir = tempfile.mkdtemp(prefix="cse564-bench-")
+    # Must be set before the backend modules are imported; compute runs in
+    # threads of this process so the traced memory and cache resets apply to it
+    os.environ["ANALYTICS_DATA_DIR"] = data_dir
+    os.environ["ANALYTICS_PROCESS_WORKERS"] = "0"
+    os.environ["ANALYTICS_MATRIX_CACHE"] = "off"
+    os.environ["ANALYTICS_SNAPSHOTS"] = "off"
+    os.environ["ARTIFACT_DIR"] = os.path.join(data_dir, "artifacts")
+    sys.path.insert(0, BASE_DIR)
+
+    results = []
+    try:
+        for rows in sizes:
+            print(f"merged_df with {rows} rows")
+            prepare_data_dir(data_dir, rows, args)
+            if args.only in (None, "services"):
+                results.extend(bench_services(rows, args.repeat))
+            if args.only in (None, "endpoints"):
+                results.extend(bench_endpoints(rows, args.repeat))
+            if args.only in (None, "coldstart"):
+                results.extend(bench_cold_start(rows, args.repeat, data_dir, args.cold_start_workers))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "args": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
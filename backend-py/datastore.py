@@ -0,0 +1,200 @@
+"""
+Process-wide store for the data files served by the backend.
+
+Every file is parsed once per process and kept in memory together with the
+values derived from it. Each request only stats the file; when the mtime or
+size changes the content hash is recomputed and the entry is rebuilt if the
+hash differs, so anything memoized on a dataset is automatically dropped when
+the underlying file changes. Each dataset keeps at most MEMO_MAX_ENTRIES
+memoized values; the least recently used are dropped (and recomputed, or
+restored from a snapshot, when asked for again).
+"""
+import contextvars
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# ANALYTICS_DATA_DIR points the services at another set of data files (e.g. benchmarks)
+DATA_DIR = os.environ.get("ANALYTICS_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+# Memoized values kept per dataset, so arbitrary query parameters cannot grow it without bound
+MEMO_MAX_ENTRIES = int(os.environ.get("ANALYTICS_MEMO_MAX_ENTRIES", "128"))
+
+# Set by recomputing(): memoize() ignores stored values and stores nothing
+_recompute = contextvars.ContextVar("datastore_recompute", default=False)
+
+
+@contextmanager
+def recomputing():
+    """
+    Within this block every memoized value is computed again (and not kept),
+    so a profiled request pays for the fits a cold request would. Loaded
+    files stay cached.
+    """
+    token = _recompute.set(True)
+    try:
+        yield
+    finally:
+        _recompute.reset(token)
+
+
+class Dataset:
+    """A loaded data file plus everything memoized from it."""
+
+    def __init__(self, path, version, stat_key, data, snapshot=None):
+        self.path = path
+        self.version = version
+        self.stat_key = stat_key
+        self.data = data
+        self.snapshot = snapshot
+        self._memo = OrderedDict()
+        self._memo_locks = {}
+        self._lock = threading.Lock()
+
+    def memoize(self, key, compute):
+        """
+        Returns the value stored under key, calling compute() to create it on
+        the first request. Concurrent callers asking for the same key wait for
+        a single computation instead of repeating it. Keys the dataset's
+        snapshot covers are restored from it, or saved to it once computed.
+        """
+        kind = key[0] if isinstance(key, tuple) else key
+        if _recompute.get():
+            with metrics.span(f"compute-{kind}"):
+                return compute()
+
+        with self._lock:
+            hit = key in self._memo
+            if hit:
+                self._memo.move_to_end(key)
+                value = self._memo[key]
+            else:
+                key_lock = self._memo_locks.setdefault(key, threading.Lock())
+        if hit:
+            metrics.count(f"memo-{kind}", True)
+            return value
+
+        with key_lock:
+            with self._lock:
+                hit = key in self._memo
+                value = self._memo.get(key)
+            if not hit:
+                value = self._restore_or_compute(key, kind, compute)
+                self._remember(key, value)
+        metrics.count(f"memo-{kind}", hit)
+        return value
+
+    def memoized_keys(self):
+        """Returns the keys memoized right now, e.g. to find a value that can stand in for another."""
+        with self._lock:
+            return list(self._memo)
+
+    def _remember(self, key, value):
+        # Least recently used values go first once the memo is full
+        with self._lock:
+            self._memo[key] = value
+            while len(self._memo) > MEMO_MAX_ENTRIES:
+                evicted, _ = self._memo.popitem(last=False)
+                self._memo_locks.pop(evicted, None)
+
+    def _restore_or_compute(self, key, kind, compute):
+        snapshotted = self.snapshot is not None and self.snapshot.covers(key)
+        if snapshotted:
+            found, value = self.snapshot.lookup(self.version, key)
+            if found:
+                return value
+        with metrics.span(f"compute-{kind}"):
+            value = compute()
+        if snapshotted:
+            self.snapshot.store(self.version, key, value)
+        return value
+
+
+_entries = {}
+_versions = {}
+_path_locks = {}
+_store_lock = threading.Lock()
+
+
+def _path_lock(path):
+    with _store_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def file_version(path):
+    """
+    Returns the content hash of a file, only re-reading the file when its
+    mtime or size has changed since the last call.
+    """
+    stat_key = _stat_key(path)
+    cached = _versions.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    version = _hash_file(path)
+    _versions[path] = (stat_key, version)
+    return version
+
+
+def get_dataset(path, loader, snapshot=None):
+    """
+    Returns the Dataset for path, calling loader(path) to build its data the
+    first time and again whenever the file content changes.
+
+    Args:
+        path (str): Absolute path of the data file
+        loader (callable): Parses the file and returns the data to keep
+        snapshot (snapshots.Snapshot, optional): Persists memoized fits so
+            other processes can restore them
+
+    Returns:
+        Dataset: The current entry for the file
+    """
+    entry = _entries.get(path)
+    stat_key = _stat_key(path)
+    if entry is not None and entry.stat_key == stat_key:
+        return entry
+
+    with _path_lock(path):
+        entry = _entries.get(path)
+        stat_key = _stat_key(path)
+        if entry is not None and entry.stat_key == stat_key:
+            return entry
+
+        version = file_version(path)
+        if entry is not None and entry.version == version:
+            # Touched but unchanged: keep the parsed data and memoized values
+            entry.stat_key = stat_key
+            return entry
+
+        with metrics.span(f"load-{os.path.basename(path)}"):
+            entry = Dataset(path, version, stat_key, loader(path), snapshot)
+        _entries[path] = entry
+        return entry
+
+
+def clear():
+    """Drops every loaded dataset (used when data files are replaced wholesale)."""
+    with _store_lock:
+        _entries.clear()
+        _versions.clear()
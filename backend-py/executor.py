@@ -0,0 +1,247 @@
+"""
+Compute executors that keep analytics work off the asyncio event loop.
+
+Heavy fits (PCA, KMeans, MDS and everything built on them) run in a process
+pool, and file-backed views run in a thread pool. Each call goes through a
+per-endpoint concurrency limit and a global bound on queued plus running
+calls; past that bound the request is rejected with 503 instead of piling up.
+If a worker process dies (killed, out of memory) the process pool is broken:
+the requests it was running get a 503 and the next heavy call starts a new
+pool.
+
+Configuration (environment variables):
+    ANALYTICS_PROCESS_WORKERS   worker processes for heavy views, 0 runs them
+                                in the thread pool (default: min(4, CPUs))
+    ANALYTICS_IO_THREADS        threads for file-backed views (default: 8)
+    ANALYTICS_MAX_QUEUE         queued + running calls before 503 (default: 64)
+    ANALYTICS_CONCURRENCY       per-endpoint limits, e.g. "mdp=1,kmeans=2"
+                                (unlisted endpoints default to 4)
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+
+from fastapi import HTTPException
+
+import metrics
+
+PROCESS_WORKERS = int(os.environ.get("ANALYTICS_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+IO_THREADS = int(os.environ.get("ANALYTICS_IO_THREADS", "8"))
+MAX_QUEUE_DEPTH = int(os.environ.get("ANALYTICS_MAX_QUEUE", "64"))
+DEFAULT_CONCURRENCY = 4
+
+
+def _parse_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            endpoint, limit = item.split("=", 1)
+            limits[endpoint.strip()] = int(limit)
+    return limits
+
+
+# The slowest endpoints get fewer slots so they cannot occupy every worker
+ENDPOINT_CONCURRENCY = {"mdp": 1, "kmeans": 2, "biplot": 2, "scatterplot_matrix": 2, "pdp": 2, "batch": 2}
+ENDPOINT_CONCURRENCY.update(_parse_limits(os.environ.get("ANALYTICS_CONCURRENCY", "")))
+
+_process_pool = None
+_process_initializer = None
+_thread_pool = None
+_semaphores = {}
+_pending = 0
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn instead of fork: the server process already runs threads
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_process_initializer
+        )
+    return _process_pool
+
+
+def _discard_process_pool(pool):
+    # Drops a broken pool so the next heavy call starts a new one; concurrent
+    # callers that saw the same pool break only discard it once
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+        print("A compute worker died, restarting the process pool")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ready():
+    return True
+
+
+def start(initializer=None):
+    """
+    Starts the worker processes in the background (called when the app
+    starts), each running initializer() first, so the first requests do not
+    wait for workers to spawn and import the model libraries. Pools started
+    after a worker died run the same initializer.
+    """
+    global _process_initializer
+    _process_initializer = initializer
+    if PROCESS_WORKERS > 0:
+        # With spawn the pool starts a worker per submission while none is idle
+        pool = _get_process_pool()
+        for _ in range(PROCESS_WORKERS):
+            pool.submit(_ready)
+
+
+def _get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="analytics-io")
+    return _thread_pool
+
+
+def _semaphore(endpoint):
+    if endpoint not in _semaphores:
+        _semaphores[endpoint] = asyncio.Semaphore(ENDPOINT_CONCURRENCY.get(endpoint, DEFAULT_CONCURRENCY))
+    return _semaphores[endpoint]
+
+
+async def run(endpoint, fn, *args, heavy=True, **kwargs):
+    """
+    Runs fn(*args, **kwargs) in the process pool (heavy) or the thread pool
+    and returns its result without blocking the event loop.
+
+    Raises:
+        HTTPException: 503 when MAX_QUEUE_DEPTH calls are already queued or
+            running, or when a worker process died while running the call
+    """
+    global _pending
+    if _pending >= MAX_QUEUE_DEPTH:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
+
+    if heavy and PROCESS_WORKERS > 0:
+        pool = _get_process_pool()
+    else:
+        pool = _get_thread_pool()
+
+    _pending += 1
+    try:
+        queued_at = time.perf_counter()
+        async with _semaphore(endpoint):
+            metrics.observe("queue", time.perf_counter() - queued_at)
+            loop = asyncio.get_running_loop()
+            # Spans recorded by the worker come back with the result
+            try:
+                result, recorder = await loop.run_in_executor(pool, functools.partial(metrics.collect, fn, *args, **kwargs))
+            except BrokenProcessPool:
+                _discard_process_pool(pool)
+                raise HTTPException(status_code=503, detail="Compute worker restarted, retry shortly", headers={"Retry-After": "1"})
+            metrics.merge(recorder)
+            return result
+    finally:
+        _pending -= 1
+
+
+class _ConnectionSink:
+    """
+    Sink handed to a worker process by stream(): it connects back to the API
+    process on the first put and sends every item over that connection.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"address": self.address, "authkey": self.authkey}
+
+    def __setstate__(self, state):
+        self.__init__(state["address"], state["authkey"])
+
+    def put(self, item):
+        with self._lock:
+            if self._connection is None:
+                self._connection = Client(self.address, authkey=self.authkey)
+            self._connection.send(item)
+            if item is None:
+                self._connection.close()
+
+
+async def _unless_failed(task, call, unblock):
+    # Runs call() in a thread; if task fails first, unblock() releases the
+    # thread and the task's error is raised instead
+    waiter = asyncio.ensure_future(asyncio.to_thread(call))
+    await asyncio.wait({waiter, task}, return_when=asyncio.FIRST_COMPLETED)
+    if not waiter.done() and task.exception() is not None:
+        unblock()
+        await waiter
+        task.result()
+    return await waiter
+
+
+async def stream(endpoint, fn, *args, heavy=True):
+    """
+    Runs fn(sink, *args) like run() and yields every item fn puts on sink, as
+    it arrives, until fn puts None. fn must put None when it is done, also on
+    failure. Errors raised by fn (or a 503 from run) are raised after the
+    items already yielded.
+
+    Worker processes send their items back over a local socket, threads use
+    a queue.
+    """
+    listener = connection = None
+    if heavy and PROCESS_WORKERS > 0:
+        authkey = os.urandom(32)
+        listener = Listener(authkey=authkey)
+        sink = _ConnectionSink(listener.address, authkey)
+    else:
+        sink = queue.Queue()
+
+    task = asyncio.ensure_future(run(endpoint, fn, sink, *args, heavy=heavy))
+    finished = False
+    try:
+        if listener is not None:
+            connection = await _unless_failed(
+                task, listener.accept, lambda: Client(listener.address, authkey=authkey).close()
+            )
+            receive, unblock = connection.recv, lambda: None
+        else:
+            receive, unblock = sink.get, lambda: sink.put(None)
+
+        while True:
+            item = await _unless_failed(task, receive, unblock)
+            if item is None:
+                break
+            yield item
+        finished = True
+        await task
+    finally:
+        if connection is not None:
+            connection.close()
+        if listener is not None:
+            listener.close()
+        if not finished:
+            # The client went away; the worker's sends fail and its result is dropped
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+
+def shutdown():
+    """Stops the worker pools (called when the app shuts down)."""
+    global _process_pool, _process_initializer, _thread_pool
+    _process_initializer = None
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(cancel_futures=True)
+        _thread_pool = None
+    _semaphores.clear()
@@ -0,0 +1,252 @@
+"""
+Topology-preserving simplification and TopoJSON-style encoding of polygon
+feature collections.
+
+Rings are split into arcs at junctions, the points where the borders of two
+or more rings meet or part. A border shared by neighbouring polygons becomes
+one arc that is stored once and simplified once. Neighbours therefore keep
+identical edges at every tolerance, with no gaps or overlaps. The arcs then
+serve two purposes: they are reassembled into GeoJSON rings, or written out
+as a quantized, delta-encoded TopoJSON topology.
+"""
+import numpy as np
+
+# Grid used to detect coincident vertices (about 1e-7 degrees for NYC)
+_JOIN_QUANTIZATION = 1e7
+
+
+def _polygons(geometry):
+    # Polygon and MultiPolygon geometries as a list of polygons (lists of rings)
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Unsupported geometry type {geometry['type']}")
+
+
+def _open_ring(ring):
+    points = np.asarray(ring, dtype=float)[:, :2]
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    return points
+
+
+def build_topology(features):
+    """
+    Splits the rings of Polygon/MultiPolygon features into shared arcs.
+
+    Returns:
+        dict: "arcs" (list of float arrays of positions) and "geometries", one
+        entry per feature holding, per polygon and ring, the list of arc
+        references (~i means arc i reversed)
+    """
+    rings = []
+    for feature in features:
+        for polygon in _polygons(feature["geometry"]):
+            for ring in polygon:
+                rings.append(_open_ring(ring))
+
+    bbox_min = np.min([ring.min(axis=0) for ring in rings], axis=0)
+    keys = [
+        [tuple(p) for p in np.round((ring - bbox_min) * _JOIN_QUANTIZATION).astype(np.int64).tolist()]
+        for ring in rings
+    ]
+
+    # A vertex is a junction when it is seen with different neighbours
+    neighbours = {}
+    junctions = set()
+    for ring_keys in keys:
+        n = len(ring_keys)
+        for i, key in enumerate(ring_keys):
+            pair = frozenset((ring_keys[i - 1], ring_keys[(i + 1) % n]))
+            seen = neighbours.setdefault(key, pair)
+            if seen != pair:
+                junctions.add(key)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(points, arc_keys):
+        forward = tuple(arc_keys)
+        if forward in arc_index:
+            return arc_index[forward]
+        backward = forward[::-1]
+        if backward in arc_index:
+            return ~arc_index[backward]
+        arc_index[forward] = len(arcs)
+        arcs.append(points)
+        return len(arcs) - 1
+
+    ring_arcs = []
+    for ring, ring_keys in zip(rings, keys):
+        n = len(ring_keys)
+        cuts = [i for i, key in enumerate(ring_keys) if key in junctions]
+        if not cuts:
+            # Free-standing ring: one closed arc starting at its smallest vertex
+            # so identical rings elsewhere produce the same arc
+            start = min(range(n), key=ring_keys.__getitem__)
+            order = [(start + j) % n for j in range(n + 1)]
+            ring_arcs.append([add_arc(ring[order], [ring_keys[i] for i in order])])
+            continue
+
+        refs = []
+        for c, start in enumerate(cuts):
+            end = cuts[(c + 1) % len(cuts)]
+            length = (end - start) % n or n
+            order = [(start + j) % n for j in range(length + 1)]
+            refs.append(add_arc(ring[order], [ring_keys[i] for i in order]))
+        ring_arcs.append(refs)
+
+    geometries = []
+    cursor = 0
+    for feature in features:
+        polygons = []
+        for polygon in _polygons(feature["geometry"]):
+            polygons.append(ring_arcs[cursor:cursor + len(polygon)])
+            cursor += len(polygon)
+        geometries.append(polygons)
+
+    return {"arcs": arcs, "geometries": geometries}
+
+
+def _douglas_peucker(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+
+def _triangle_splits(points):
+    # The vertex farthest from the start, then the one farthest from the line
+    # through both: kept by a closed arc, they span a triangle
+    first = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    segment = points[first] - points[0]
+    inner = points - points[0]
+    distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0])
+    distances[[0, first, len(points) - 1]] = -1
+    second = int(np.argmax(distances))
+    return sorted((first, second))
+
+
+def simplify_arc(points, tolerance):
+    """
+    Douglas-Peucker simplification that always keeps the arc's endpoints. A
+    closed arc (a ring of its own) keeps at least a triangle.
+    """
+    if tolerance <= 0 or len(points) < 3:
+        return points
+    if np.array_equal(points[0], points[-1]):
+        if len(points) < 5:
+            return points
+        # Simplify the three pieces between the start and both split vertices
+        bounds = [0] + _triangle_splits(points) + [len(points) - 1]
+        pieces = [_douglas_peucker(points[a:b + 1], tolerance) for a, b in zip(bounds, bounds[1:])]
+        return np.vstack([pieces[0]] + [piece[1:] for piece in pieces[1:]])
+    return _douglas_peucker(points, tolerance)
+
+
+def simplify_topology(topology, tolerance):
+    """
+    Returns the topology's arcs simplified with the given tolerance. An arc of
+    a ring that would collapse below a triangle (two arcs simplified to the
+    same straight segment) keeps its original vertices, and so does every
+    other ring sharing it, so neighbours stay consistent.
+    """
+    arcs = topology["arcs"]
+    simplified = [simplify_arc(arc, tolerance) for arc in arcs]
+    for polygons in topology["geometries"]:
+        for polygon in polygons:
+            for refs in polygon:
+                if len(_ring_positions(refs, simplified)) < 4:
+                    for ref in refs:
+                        index = ref if ref >= 0 else ~ref
+                        simplified[index] = arcs[index]
+    return simplified
+
+
+def _ring_positions(refs, arcs):
+    parts = []
+    for ref in refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        parts.append(arc if not parts else arc[1:])
+    ring = np.vstack(parts)
+    if not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack([ring, ring[:1]])
+    return ring
+
+
+def to_geojson(features, topology, arcs, decimals=6):
+    """
+    Rebuilds a GeoJSON FeatureCollection from (simplified) arcs; see
+    simplify_topology for how rings are kept from collapsing.
+    """
+    output = []
+    for feature, polygons in zip(features, topology["geometries"]):
+        coordinates = []
+        for polygon_refs in polygons:
+            coordinates.append([np.round(_ring_positions(refs, arcs), decimals).tolist() for refs in polygon_refs])
+        geometry_type = feature["geometry"]["type"]
+        output.append({
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": {
+                "type": geometry_type,
+                "coordinates": coordinates[0] if geometry_type == "Polygon" else coordinates
+            }
+        })
+    return {"type": "FeatureCollection", "features": output}
+
+
+def to_topojson(features, topology, arcs, object_name, quantization=1e5):
+    """
+    Encodes features as a TopoJSON Topology with quantized, delta-encoded arcs
+    shared between neighbouring geometries.
+    """
+    all_points = np.vstack(arcs)
+    bbox_min = all_points.min(axis=0)
+    bbox_max = all_points.max(axis=0)
+    scale = np.where(bbox_max > bbox_min, (bbox_max - bbox_min) / (quantization - 1), 1.0)
+
+    encoded_arcs = []
+    for arc in arcs:
+        quantized = np.round((arc - bbox_min) / scale).astype(np.int64)
+        # Drop consecutive duplicates created by quantization, keeping both ends
+        moved = np.r_[True, np.any(quantized[1:] != quantized[:-1], axis=1)]
+        moved[-1] = True
+        quantized = quantized[moved]
+        encoded_arcs.append(np.vstack([quantized[:1], np.diff(quantized, axis=0)]).tolist())
+
+    geometries = []
+    for feature, polygons in zip(features, topology["geometries"]):
+        geometry_type = feature["geometry"]["type"]
+        geometries.append({
+            "type": geometry_type,
+            "arcs": polygons[0] if geometry_type == "Polygon" else polygons,
+            "properties": feature["properties"]
+        })
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale.tolist(), "translate": bbox_min.tolist()},
+        "bbox": bbox_min.tolist() + bbox_max.tolist(),
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded_arcs
+    }
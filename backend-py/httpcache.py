@@ -0,0 +1,204 @@
+"""
+HTTP caching for the API responses.
+
+Every response depends only on the data files behind its endpoint, the
+request parameters and the negotiated media type, so its ETag is a hash of
+exactly those: the content hashes of the files, the normalized parameters and
+a hash of the backend source and of the settings that shape responses (PCA
+solver, MDS limits, out-of-core mode; see services.response_settings). A
+request whose If-None-Match still matches is answered with 304 before any
+service code runs.
+
+Rendered bodies are kept in memory under their ETag, together with gzip and
+(if the optional `brotli` package is installed) brotli encodings that are
+compressed once, on first request, and then reused. Each encoding is its own
+representation, so its ETag carries a "-gzip"/"-br" suffix.
+
+Configuration (environment variables):
+    HTTP_CACHE_MAX_AGE      seconds browsers may reuse a response without
+                            revalidating it (default: 0, always revalidate)
+    HTTP_CACHE_MAX_BYTES    memory for cached bodies and their encodings
+                            (default: 256 MiB)
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+from artifacts import SOURCE_VERSION, params_key
+from datastore import file_version
+from services import MERGED_DF_PATH, CRIME_DATA_PATH, SUNBURST_DF_PATH, NTA_GEOJSON_PATH, BOROUGH_GEOJSON_PATH
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", "0"))
+MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", str(256 << 20)))
+CACHE_CONTROL = f"public, max-age={MAX_AGE}, must-revalidate"
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Data files each endpoint's responses are computed from
+ENDPOINT_FILES = {
+    "eigenValues": (MERGED_DF_PATH,),
+    "biplot": (MERGED_DF_PATH,),
+    "top_features": (MERGED_DF_PATH,),
+    "pca_loadings": (MERGED_DF_PATH,),
+    "kmeans": (MERGED_DF_PATH,),
+    "scatterplot_matrix": (MERGED_DF_PATH,),
+    "mdp": (MERGED_DF_PATH,),
+    "pdp": (MERGED_DF_PATH,),
+    "crime_data": (CRIME_DATA_PATH,),
+    "sunburst_data": (SUNBURST_DF_PATH,),
+    "nta_geo": (NTA_GEOJSON_PATH,),
+    "borough_geo": (BOROUGH_GEOJSON_PATH,)
+}
+
+
+def _file_version(path):
+    try:
+        return file_version(path)
+    except FileNotFoundError:
+        return "missing"
+
+
+def compute_etag(endpoint, params, media_type):
+    """
+    Returns the strong ETag (quoted) of a response, from the content hashes of
+    the endpoint's data files and the normalized request parameters.
+    """
+    versions = [_file_version(path) for path in ENDPOINT_FILES.get(endpoint, ())]
+    digest = hashlib.sha1("|".join([SOURCE_VERSION, endpoint, params_key(params, media_type), *versions]).encode("utf-8"))
+    return f'"{digest.hexdigest()[:24]}"'
+
+
+def encoded_etag(etag, encoding):
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+def if_none_match(request, etag):
+    """
+    Returns the entry of the request's If-None-Match that matches the ETag in
+    any encoding (the one to send back with the 304), or None.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return etag
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate[:-1].rsplit("-", 1)[0] == etag[:-1]:
+            return candidate
+    return None
+
+
+def negotiate_encoding(request):
+    """Picks br, gzip or identity from Accept-Encoding."""
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, options = item.strip().partition(";")
+        quality = 1.0
+        if options.strip().startswith("q="):
+            try:
+                quality = float(options.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the gzip bytes (and so the ETag's meaning) deterministic
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CachedBody:
+    """A rendered response body and its compressed encodings."""
+
+    def __init__(self, body):
+        self.encodings = {"identity": body}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return sum(len(body) for body in self.encodings.values() if body is not None)
+
+    def encoded(self, encoding):
+        """
+        Returns (encoding, body) for the requested encoding, compressing on
+        first use. Small bodies, and encodings that do not make the body
+        smaller, fall back to identity.
+        """
+        body = self.encodings["identity"]
+        if encoding == "identity" or len(body) < MIN_COMPRESS_BYTES:
+            return "identity", body
+        with self._lock:
+            if encoding not in self.encodings:
+                compressed = _compress(body, encoding)
+                self.encodings[encoding] = compressed if len(compressed) < len(body) else None
+        compressed = self.encodings[encoding]
+        if compressed is None:
+            return "identity", body
+        return encoding, compressed
+
+
+_bodies = OrderedDict()
+_bodies_lock = threading.Lock()
+
+
+def get_body(etag):
+    """Returns the CachedBody stored under an ETag, or None."""
+    with _bodies_lock:
+        entry = _bodies.get(etag)
+        if entry is not None:
+            _bodies.move_to_end(etag)
+        return entry
+
+
+def _evict():
+    # Least recently used first; caller holds _bodies_lock
+    total_bytes = sum(entry.size for entry in _bodies.values())
+    while total_bytes > MAX_BYTES and len(_bodies) > 1:
+        _, entry = _bodies.popitem(last=False)
+        total_bytes -= entry.size
+
+
+def store_body(etag, body):
+    """Caches a rendered body under its ETag and returns its CachedBody."""
+    with _bodies_lock:
+        entry = _bodies.get(etag)
+        if entry is None:
+            entry = _bodies[etag] = CachedBody(body)
+        _evict()
+        return entry
+
+
+def encode(entry, encoding):
+    """Compressed body for a cached entry, re-checking the memory bound."""
+    with metrics.span("compress"):
+        result = entry.encoded(encoding)
+    with _bodies_lock:
+        _evict()
+    return result
+
+
+def headers(etag, vary):
+    """Caching headers for a response or a 304."""
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": ", ".join(vary)}
@@ -1,10 +1,33 @@
-from fastapi import FastAPI, Query
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import json
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from services import perform_pca, get_biplot_data, top_features, get_scatterplot_matrix_data, get_pca_loadings, perform_kmeans, compute_mds_json, compute_parallel_coordinates_json, get_crime_data_by_hour, get_sunburst_data, get_nta_geojson
+import artifacts
+import batch
+import executor
+import httpcache
+import metrics
+import profiling
+import services
+import singleflight
+import views
+from responses import FastJSONResponse, JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, negotiate_media_type, render, render_view
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Spawn and warm the compute workers while the map geometries are parsed,
+    # validated and simplified, all before the first request
+    executor.start(services.warm_worker)
+    await asyncio.to_thread(services.warm_geo_cache)
+    yield
+    executor.shutdown()
+
+
+# Handlers return pre-rendered bodies; FastJSONResponse covers anything else
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -14,119 +37,329 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it wraps everything else: times the whole request, CORS included
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+async def service_error(request, error):
+    # Service exceptions carry no HTTP details; views.error_status maps them
+    status, detail = views.error_status(error)
+    return FastJSONResponse({"detail": detail}, status_code=status)
+
+
+for error_type in views.ERROR_STATUS:
+    app.add_exception_handler(error_type, service_error)
+
+
+async def serve_view(request, endpoint, view, heavy=True, columnar=False, **params):
+    """
+    Builds and serializes a view on the compute executor so the event loop only
+    sends the finished body. Columnar views negotiate the binary format, and
+    concurrent identical requests share a single computation. A precomputed
+    artifact for the current dataset is served as-is when one exists.
+
+    Responses carry an ETag derived from the dataset hashes and parameters: a
+    matching If-None-Match gets a 304 without touching the view, and bodies
+    are kept in memory with their gzip/brotli encodings for repeat requests.
+
+    A request asking to be profiled (see profiling.py) bypasses all of that
+    and runs the view under the profiler.
+    """
+    media_type = negotiate_media_type(request) if columnar else JSON_MEDIA_TYPE
+    vary = ["Accept", "Accept-Encoding"] if columnar else ["Accept-Encoding"]
+
+    profile = profiling.requested(request)
+    if profile is not None:
+        request_id = profiling.request_id(request)
+        body, _ = await executor.run(
+            endpoint, profiling.run, request_id, profile, endpoint, params,
+            render_view, view, params, media_type, heavy=heavy
+        )
+        headers = {"X-Profile-Id": request_id, "Cache-Control": "no-store"}
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    etag = await asyncio.to_thread(httpcache.compute_etag, endpoint, params, media_type)
+
+    matched = httpcache.if_none_match(request, etag)
+    metrics.count("http-etag", "not-modified" if matched is not None else "modified")
+    if matched is not None:
+        return Response(status_code=304, headers=httpcache.headers(matched, vary))
+
+    entry = httpcache.get_body(etag)
+    metrics.count("http-body", entry is not None)
+    if entry is None:
+        body = await asyncio.to_thread(artifacts.load_artifact, endpoint, params, media_type)
+        if body is None:
+            key = singleflight.request_key(endpoint, params, media_type)
+            body = await singleflight.coalesce(
+                key, lambda: executor.run(endpoint, render_view, view, params, media_type, heavy=heavy)
+            )
+        entry = httpcache.store_body(etag, body)
+
+    encoding, body = await asyncio.to_thread(httpcache.encode, entry, httpcache.negotiate_encoding(request))
+    headers = httpcache.headers(httpcache.encoded_etag(etag, encoding), vary)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
 
 @app.get("/eigenValues")
-async def get_eigen_values():
-    result = perform_pca()
-    return {"explained_variance_ratio": result["explainedVarianceRatio"]}
+async def get_eigen_values(request: Request):
+    return await serve_view(request, "eigenValues", views.eigen_values_view)
 
 @app.get("/biplot")
-async def get_biplot(dimensions: Optional[List[int]] = Query(None, description="List of dimensions to include in the biplot")):
+async def get_biplot(request: Request, dimensions: Optional[List[int]] = Query(None, description="List of dimensions to include in the biplot")):
     # Pass dimensions directly to get_biplot_data, which now handles defaults appropriately
-    result = get_biplot_data(dimensions)
-    return {"biplot": result}
+    return await serve_view(request, "biplot", views.biplot_view, columnar=True, dimensions=dimensions)
+
+@app.get("/biplot/stream")
+async def stream_biplot(
+    request: Request,
+    dimensions: Optional[List[int]] = Query(None, description="List of dimensions to include in the biplot"),
+    offset: int = Query(0, ge=0, description="First point row to send"),
+    limit: Optional[int] = Query(None, ge=1, description="Number of point rows to send (defaults to all remaining)"),
+    chunk_size: int = Query(5000, ge=1, le=100000, description="Point rows per streamed line")
+):
+    """
+    Streams the biplot as newline-delimited JSON: a "header" line with the
+    loadings, variance, feature names and row range, then "rows" lines of up
+    to chunk_size pcScores/pointLabels/originalData rows each, then an "end"
+    line. offset/limit select one page of points. Each chunk is rendered in
+    a worker only when the client is ready for it, so neither process holds
+    the whole serialized payload.
+    """
+    params = {"dimensions": dimensions, "offset": offset, "limit": limit, "chunk_size": chunk_size}
+    etag = await asyncio.to_thread(httpcache.compute_etag, "biplot", params, NDJSON_MEDIA_TYPE)
+    matched = httpcache.if_none_match(request, etag)
+    if matched is not None:
+        return Response(status_code=304, headers=httpcache.headers(matched, ["Accept-Encoding"]))
+
+    header = await executor.run("biplot", views.biplot_stream_header_view, dimensions, offset, limit)
+
+    async def lines():
+        yield render(header, NDJSON_MEDIA_TYPE)
+        try:
+            for start in range(header["offset"], header["stop"], chunk_size):
+                stop = min(start + chunk_size, header["stop"])
+                yield await executor.run(
+                    "biplot", render_view, views.biplot_rows_view, {"start": start, "stop": stop}, NDJSON_MEDIA_TYPE
+                )
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-band
+            status, detail = views.error_status(e)
+            yield render({"type": "error", "status": status, "error": detail}, NDJSON_MEDIA_TYPE)
+            return
+        yield render({"type": "end", "rows": header["stop"] - header["offset"]}, NDJSON_MEDIA_TYPE)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=httpcache.headers(etag, ["Accept-Encoding"]))
 
 @app.get("/top_features")
-async def get_top_features(dimensions: int = Query(2, description="Number of PCA dimensions to consider")):
-    features = top_features(dimensions)
-    return {"top_features": features}
+async def get_top_features(request: Request, dimensions: int = Query(2, ge=1, description="Number of PCA dimensions to consider")):
+    return await serve_view(request, "top_features", views.top_features_view, dimensions=dimensions)
 
 @app.get("/scatterplot_matrix")
 async def get_scatterplot_matrix(
-    dimensions: int = Query(2, description="Number of PCA dimensions to consider"),
-    n_clusters: int = Query(3, description="Number of clusters to create")
+    request: Request,
+    dimensions: int = Query(2, ge=1, description="Number of PCA dimensions to consider"),
+    n_clusters: int = Query(3, ge=1, le=services.MAX_CLUSTERS, description="Number of clusters to create"),
+    mode: str = Query("points", pattern="^(points|binned)$", description="Every point, or 2D counts per feature pair and cluster"),
+    bins: int = Query(32, ge=2, le=services.SCATTERPLOT_MAX_BINS, description="Bins across each axis when mode is binned"),
+    bin_shape: str = Query("square", pattern="^(square|hex)$", description="Square bins or hexagons when mode is binned")
 ):
-    result = get_scatterplot_matrix_data(dimensions, n_clusters)
-    return {"scatterplot_matrix": result}
+    params = {"dimensions": dimensions, "n_clusters": n_clusters}
+    if mode == "binned":
+        params.update(mode=mode, bins=bins, bin_shape=bin_shape)
+    return await serve_view(request, "scatterplot_matrix", views.scatterplot_matrix_view, columnar=True, **params)
 
 
 @app.get("/pca_loadings")
-async def get_loadings(dimensions: int = Query(None, description="Number of PCA dimensions to return (defaults to all)")):
-    loadings = get_pca_loadings(dimensions)
-    return {"loadings": loadings}
+async def get_loadings(request: Request, dimensions: int = Query(None, ge=1, description="Number of PCA dimensions to return (defaults to all)")):
+    return await serve_view(request, "pca_loadings", views.pca_loadings_view, dimensions=dimensions)
 
 @app.get("/kmeans")
-def kmeans_endpoint(clusters: int = 3, dimensions: int = 2):
-    result = perform_kmeans(n_clusters=clusters, dimensions=dimensions)
-    return result
+async def kmeans_endpoint(request: Request, clusters: int = Query(3, ge=1, le=services.MAX_CLUSTERS, description="Number of clusters to create"), dimensions: int = Query(2, ge=1, description="Number of PCA dimensions to cluster on")):
+    return await serve_view(request, "kmeans", views.kmeans_view, columnar=True, clusters=clusters, dimensions=dimensions)
 
 @app.get("/mdp")
-def get_mdp(clusters: int = 3, find_optimal: bool = True):
+async def get_mdp(
+    request: Request,
+    clusters: int = Query(3, ge=1, le=services.MAX_CLUSTERS, description="Number of clusters to color the points by"),
+    find_optimal: bool = True,
+    method: str = Query("auto", pattern="^(auto|smacof|classical|landmark)$", description="MDS algorithm for the data points"),
+    landmarks: Optional[int] = Query(None, ge=3, le=services.MDS_MAX_LANDMARKS, description="Number of landmarks for landmark MDS"),
+    silhouette_sample: Optional[int] = Query(None, ge=services.SILHOUETTE_MIN_SAMPLE, description="Rows sampled per silhouette score when finding the optimal k")
+):
     """
     Returns Multidimensional Scaling (MDS) visualization data for both data points and variables.
-    
+
     Parameters:
     clusters (int): Number of clusters to use for coloring points (default: 3)
     find_optimal (bool): Whether to find the optimal number of clusters automatically (default: False)
-    
+    method (str): "smacof" (dense, small data; landmark above MDS_SMACOF_MAX_ROWS rows),
+        "classical", "landmark" or "auto" (default)
+    landmarks (int): Number of landmarks when method is "landmark" (at most MDS_MAX_LANDMARKS)
+    silhouette_sample (int): Silhouette sample size for the optimal-k search
+
     Returns:
     dict: MDS coordinates for data points and variables
     """
-    if find_optimal:
-        # If finding optimal clusters, run the MDS with optimization
-        mds_data = compute_mds_json(cluster_labels=None, find_optimal=True)
-    else:
-        # Otherwise use the user-specified number of clusters
-        kmeans_result = perform_kmeans(n_clusters=clusters)
-        cluster_labels = kmeans_result["clusterLabels"]
-        mds_data = compute_mds_json(cluster_labels=cluster_labels, find_optimal=False)
-    
-    # The function returns a JSON string, but FastAPI will handle serialization
-    return json.loads(mds_data)
+    params = {"find_optimal": find_optimal, "method": method, "landmarks": landmarks, "silhouette_sample": silhouette_sample}
+    if not find_optimal:
+        # clusters is ignored when the optimal k is searched, so it stays out of the cache keys
+        params["clusters"] = clusters
+    return await serve_view(request, "mdp", views.mdp_view, columnar=True, **params)
 
 @app.get("/pdp")
-def get_parallel_coordinates():
+async def get_parallel_coordinates(
+    request: Request,
+    mode: str = Query("rows", pattern="^(rows|sample|histogram)$", description="Every row, a stratified sample or binned densities"),
+    sample_size: Optional[int] = Query(None, ge=1, description="Rows returned when mode is sample"),
+    stratify: Optional[str] = Query(None, description="Axis the sample keeps in proportion (defaults to the first categorical axis)"),
+    bins: int = Query(20, ge=1, le=services.PCP_MAX_BINS, description="Bins per numerical axis"),
+    pairs: str = Query("adjacent", pattern="^(adjacent|all)$", description="Axis pairs with line densities when mode is histogram")
+):
     """
     Returns data for parallel coordinates visualization.
-    
+
+    Parameters:
+    mode (str): "rows" (default, every row), "sample" or "histogram"
+    sample_size (int): Size of the stratified sample
+    stratify (str): Axis to stratify the sample on
+    bins (int): Bins per numerical axis for histograms and numerical strata
+    pairs (str): "adjacent" or "all" axis pairs for the line densities
+
     Returns:
     dict: Data formatted for parallel coordinates plotting, including encoded categorical variables and axis information
     """
-    # Call the service function to get parallel coordinates data
-    pdp_data = compute_parallel_coordinates_json()
-    
-    # Return the complete data structure
-    return pdp_data
+    params = {"mode": mode}
+    if mode == "sample":
+        params.update(sample_size=sample_size, stratify=stratify, bins=bins)
+    elif mode == "histogram":
+        params.update(bins=bins, pairs=pairs)
+    return await serve_view(request, "pdp", views.pdp_view, columnar=True, **params)
 
 @app.get("/crime_data")
-async def get_crime_data():
+async def get_crime_data(
+    request: Request,
+    boroughs: Optional[List[str]] = Query(None, description="Boroughs to include (defaults to all)"),
+    crime_types: Optional[List[str]] = Query(None, description="Crime types to include (defaults to all)"),
+    hour_min: int = Query(0, ge=0, le=23, description="First hour of day to include"),
+    hour_max: int = Query(23, ge=0, le=23, description="Last hour of day to include"),
+    rollup: Optional[str] = Query(None, pattern="^(borough|crime_type|top_types|total)$", description="Return hourly series per group instead of records"),
+    top_k: int = Query(5, ge=1, description="Crime types kept by the top_types rollup")
+):
     """
     Returns NYC crime data by hour, formatted for the stacked area chart.
+    Filters and rollups are computed server-side so the client only receives
+    the series it plots.
     """
-    crime_data = get_crime_data_by_hour()
-    return crime_data
+    return await serve_view(
+        request, "crime_data", views.crime_data_view, heavy=False,
+        boroughs=boroughs, crime_types=crime_types, hour_min=hour_min, hour_max=hour_max,
+        rollup=rollup, top_k=top_k
+    )
 
 @app.get("/sunburst_data")
-async def get_restaurant_sunburst_data():
+async def get_restaurant_sunburst_data(
+    request: Request,
+    depth: int = Query(3, ge=1, le=services.SUNBURST_MAX_DEPTH, description="Levels below the root: 1 boroughs, 2 cuisines, 3 restaurants"),
+    top_n: Optional[int] = Query(None, ge=1, description="Restaurants kept per cuisine by rating, the rest folded into 'Other'")
+):
     """
     Returns NYC restaurant data formatted for a sunburst visualization.
     """
-    sunburst_data = get_sunburst_data()
-    return sunburst_data
+    return await serve_view(request, "sunburst_data", views.sunburst_data_view, heavy=False, depth=depth, top_n=top_n)
 
 @app.get("/nta_geo")
-async def get_nta_geo_data():
+async def get_nta_geo_data(
+    request: Request,
+    level: Optional[int] = Query(None, ge=0, description="Simplification level, 0 for full precision"),
+    tolerance: Optional[float] = Query(None, ge=0, description="Largest acceptable simplification error in degrees"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Map zoom level the geometry will be drawn at"),
+    format: str = Query("geojson", pattern="^(geojson|topojson)$", description="geojson or topojson (shared quantized arcs)")
+):
     """
     Returns NYC Neighborhood Tabulation Areas (NTA) GeoJSON data for mapping.
+    Without parameters the full-precision collection is returned; level,
+    tolerance or zoom select a precomputed simplified version.
+    """
+    level = services.select_geo_level(level, tolerance, zoom)
+    return await serve_view(request, "nta_geo", views.nta_geo_view, heavy=False, level=level, geo_format=format)
+
+@app.get("/borough_geo")
+async def get_borough_geo_data(
+    request: Request,
+    level: Optional[int] = Query(None, ge=0, description="Simplification level, 0 for full precision"),
+    tolerance: Optional[float] = Query(None, ge=0, description="Largest acceptable simplification error in degrees"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Map zoom level the geometry will be drawn at"),
+    format: str = Query("geojson", pattern="^(geojson|topojson)$", description="geojson or topojson (shared quantized arcs)")
+):
+    """
+    Returns the NYC borough boundaries, with the same level selection as /nta_geo.
+    """
+    level = services.select_geo_level(level, tolerance, zoom)
+    return await serve_view(request, "borough_geo", views.borough_geo_view, heavy=False, level=level, geo_format=format)
+
+@app.post("/batch")
+async def batch_views(view_specs: List[dict] = Body(..., embed=True, alias="views", description="View specs: {view, params, id}")):
+    """
+    Computes several views in one pass and streams them as NDJSON, one line
+    per view in the order they finish (see batch.py). Intermediates shared by
+    the views (PCA, top features, cluster labels, MDS) are computed once.
+
+    Body:
+    {"views": [{"view": "eigenValues"}, {"view": "kmeans", "params": {"clusters": 4}}, ...]}
+
+    Returns:
+    A "batch" line listing the view ids, one "view" or "error" line per view
+    and an "end" line
     """
     try:
-        geojson_data = get_nta_geojson()
-        
-        # Check if there's an error or if the data is invalid
-        if isinstance(geojson_data, dict) and 'error' in geojson_data:
-            return geojson_data
-        
-        if not isinstance(geojson_data, dict) or 'type' not in geojson_data or 'features' not in geojson_data:
-            return {"error": "Invalid GeoJSON structure", "type": "FeatureCollection", "features": []}
-            
-        if not geojson_data['features'] or len(geojson_data['features']) == 0:
-            return {"error": "No features found in GeoJSON", "type": "FeatureCollection", "features": []}
-            
-        return geojson_data
-    except Exception as e:
-        print(f"Unexpected error in get_nta_geo_data endpoint: {str(e)}")
-        return {"error": f"Server error: {str(e)}", "type": "FeatureCollection", "features": []}
+        specs = batch.plan(view_specs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        yield render({"type": "batch", "views": [spec["id"] for spec in specs]}, NDJSON_MEDIA_TYPE)
+        try:
+            async for line in executor.stream("batch", batch.run, specs):
+                yield line
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-band
+            status, detail = views.error_status(e)
+            yield render({"type": "error", "status": status, "error": detail}, NDJSON_MEDIA_TYPE)
+            return
+        yield render({"type": "end", "views": len(specs)}, NDJSON_MEDIA_TYPE)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers={"Cache-Control": "no-store"})
+
+@app.get("/stats/coalescing")
+async def get_coalescing_stats():
+    """
+    Returns request-coalescing counters: requests seen, computations started,
+    requests that joined an in-flight computation and requests waiting now.
+    """
+    return singleflight.stats()
+
+@app.get("/profiles/{request_id}")
+async def get_profile(request_id: str):
+    """
+    Returns the profiling report of a request made with X-Profile or
+    ?profile=, by its X-Profile-Id. 404 when profiling is disabled.
+    """
+    report = await asyncio.to_thread(profiling.load_report, request_id) if profiling.ENABLED else None
+    if report is None:
+        raise HTTPException(status_code=404, detail="No profile with this id")
+    return report
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Returns this worker's request latency and stage duration histograms and
+    cache counters in the Prometheus text format.
+    """
+    return Response(content=metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
-    return {"message": "PCA Backend is running 🚀"}
\ No newline at end of file
+    return {"message": "PCA Backend is running 🚀"}
@@ -0,0 +1,200 @@
+"""
+Memory-mapped binary cache of the merged_df analytics matrices.
+
+The first process that loads a merged_df.csv version parses the CSV once and
+writes it to precompute/matrix/<content hash>/:
+
+    column_<i>.npy      one typed array per CSV column (numbers keep their
+                        dtype; text columns are fixed-width unicode, plus
+                        column_<i>.mask.npy marking missing values)
+    scaled.npy          the standardized feature matrix used by PCA and MDS
+    meta.json           column names and files, the feature names and the
+                        scaler's mean/scale/var
+
+Every worker then opens these files with np.load(mmap_mode="r") and builds its
+DataFrames on top of them without copying, so the pages are shared through the
+OS page cache. A worker starting on an already-ingested version skips CSV
+parsing entirely, and resident memory stays flat as workers are added. Only
+text columns are materialized per process, as pandas object arrays.
+
+Ingest ahead of time (e.g. in a deploy step) with:
+    python matrixcache.py
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from datastore import BASE_DIR, file_version
+
+MATRIX_CACHE_DIR = os.environ.get("MATRIX_CACHE_DIR", os.path.join(BASE_DIR, "precompute", "matrix"))
+
+# Bumped whenever the on-disk layout changes, so old caches are rebuilt
+FORMAT_VERSION = 1
+
+
+def cache_dir(version):
+    return os.path.join(MATRIX_CACHE_DIR, f"{version}-v{FORMAT_VERSION}")
+
+
+def _write_column(directory, index, values):
+    # Numeric columns are stored as-is; text columns as unicode plus a missing mask
+    entry = {"file": f"column_{index}.npy"}
+    if values.dtype.kind in "biufcmM":
+        np.save(os.path.join(directory, entry["file"]), values.to_numpy())
+        return entry
+
+    missing = values.isna().to_numpy()
+    text = values.astype(object).where(~missing, "").astype(str).to_numpy(dtype=str)
+    np.save(os.path.join(directory, entry["file"]), text)
+    entry["mask"] = f"column_{index}.mask.npy"
+    np.save(os.path.join(directory, entry["mask"]), missing)
+    return entry
+
+
+def write(version, data):
+    """
+    Writes the prepared merged_df matrices (see services._load_merged_df) for
+    a dataset version. The files are written to a private directory and moved
+    into place in one rename, so concurrent workers never see a partial cache;
+    if another worker finished first its cache is kept.
+    """
+    target = cache_dir(version)
+    tmp = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    raw = data["raw"]
+    columns = []
+    for index, name in enumerate(raw.columns):
+        entry = _write_column(tmp, index, raw[name])
+        entry["name"] = name
+        columns.append(entry)
+    np.save(os.path.join(tmp, "scaled.npy"), np.ascontiguousarray(data["scaled"]))
+
+    scaler = data["scaler"]
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "rows": len(raw),
+        "columns": columns,
+        "featureNames": data["featureNames"],
+        "scaler": {
+            "mean": scaler.mean_.tolist(),
+            "scale": scaler.scale_.tolist(),
+            "var": scaler.var_.tolist(),
+            "samples": int(scaler.n_samples_seen_)
+        }
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Another process published this version first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def _open_column(directory, entry):
+    values = np.load(os.path.join(directory, entry["file"]), mmap_mode="r")
+    if "mask" not in entry:
+        return values
+    missing = np.load(os.path.join(directory, entry["mask"]))
+    text = values.astype(object)
+    text[missing] = np.nan
+    return text
+
+
+def open_cache(version):
+    """
+    Opens the cached matrices of a dataset version, or returns None when the
+    version has not been ingested. DataFrame columns are read-only views of
+    the memory-mapped files.
+    """
+    directory = cache_dir(version)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    columns = {entry["name"]: _open_column(directory, entry) for entry in meta["columns"]}
+    # copy=False keeps one block per column, each a view of its file
+    raw = pd.DataFrame(columns, copy=False)
+    numeric = pd.DataFrame({name: columns[name] for name in meta["featureNames"]}, copy=False)
+
+    # Imported here so restoring a cache does not load sklearn before it is needed
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(meta["scaler"]["mean"])
+    scaler.scale_ = np.asarray(meta["scaler"]["scale"])
+    scaler.var_ = np.asarray(meta["scaler"]["var"])
+    scaler.n_samples_seen_ = meta["scaler"]["samples"]
+    scaler.n_features_in_ = len(meta["featureNames"])
+    scaler.feature_names_in_ = np.asarray(meta["featureNames"], dtype=object)
+
+    return {
+        "raw": raw,
+        "numeric": numeric,
+        "scaled": np.load(os.path.join(directory, "scaled.npy"), mmap_mode="r"),
+        "scaler": scaler,
+        "featureNames": meta["featureNames"]
+    }
+
+
+def load(path, prepare):
+    """
+    Returns the merged_df matrices for the current content of path from the
+    memory-mapped cache, ingesting the file first if this version has no cache
+    yet. prepare(path) parses the CSV and returns the matrices to store.
+    """
+    version = file_version(path)
+    with metrics.span("matrix_open"):
+        data = open_cache(version)
+    metrics.count("matrix-cache", data is not None)
+    if data is None:
+        prepared = prepare(path)
+        with metrics.span("matrix_write"):
+            write(version, prepared)
+        data = open_cache(version)
+    return data
+
+
+def prune(keep_version):
+    """Removes the caches of every dataset version other than keep_version."""
+    if not os.path.isdir(MATRIX_CACHE_DIR):
+        return []
+    removed = []
+    keep = os.path.basename(cache_dir(keep_version))
+    for name in os.listdir(MATRIX_CACHE_DIR):
+        if name != keep:
+            shutil.rmtree(os.path.join(MATRIX_CACHE_DIR, name), ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def main():
+    # Imported here because services imports this module (and snapshots with it)
+    import snapshots
+    from services import MERGED_DF_PATH, _read_merged_df
+
+    version = file_version(MERGED_DF_PATH)
+    if open_cache(version) is None:
+        print(f"Wrote {write(version, _read_merged_df(MERGED_DF_PATH))}")
+    else:
+        print(f"Cache for dataset {version} already exists")
+    removed = prune(version)
+    if removed:
+        print(f"Pruned {len(removed)} stale caches")
+    removed = snapshots.prune(version)
+    if removed:
+        print(f"Pruned {len(removed)} stale model snapshot sets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Lightweight timing and cache instrumentation.
+
+Service code marks its stages with `with metrics.span("pca_fit"):` and cache
+lookups with `metrics.count("memo-pca", hit)`. Names are Server-Timing tokens,
+so they only use letters, digits, "-", "_" and ".".
+
+While a request is being handled these go to the request's Recorder. The middleware then folds them
+into the process-wide histograms and reports them to the client in a
+Server-Timing header. Outside a request they go straight to the histograms.
+
+Work done in the compute executor runs under collect(), which gives it its
+own Recorder and returns the recorded spans with the result, so stages
+measured in worker processes reach the API process.
+
+GET /metrics exposes the registry in the Prometheus text format:
+
+    cse564_http_request_duration_seconds{endpoint,method,status}  histogram
+    cse564_stage_duration_seconds{stage}                           histogram
+    cse564_cache_requests_total{cache,result}                      counter
+
+Each uvicorn worker keeps its own registry, so scrape every worker. A span
+costs two perf_counter() calls and a list append.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_PREFIX = "cse564"
+
+_current = contextvars.ContextVar("metrics_recorder", default=None)
+
+
+class Recorder:
+    """Spans and cache results recorded while handling one request or task."""
+
+    def __init__(self):
+        self.stages = []
+        self.caches = []
+
+    def merge(self, other):
+        self.stages.extend(other.stages)
+        self.caches.extend(other.caches)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Process-wide histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.stages = {}
+        self.caches = {}
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            self.requests.setdefault((endpoint, method, str(status)), _Histogram()).observe(seconds)
+
+    def record(self, recorder):
+        with self._lock:
+            for stage, seconds in recorder.stages:
+                self.stages.setdefault(stage, _Histogram()).observe(seconds)
+            for cache, result in recorder.caches:
+                self.caches[(cache, result)] = self.caches.get((cache, result), 0) + 1
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            _render_histograms(
+                lines, "http_request_duration_seconds", "End-to-end request latency",
+                ("endpoint", "method", "status"), self.requests
+            )
+            _render_histograms(
+                lines, "stage_duration_seconds", "Time spent in each instrumented stage",
+                ("stage",), {(stage,): histogram for stage, histogram in self.stages.items()}
+            )
+            name = f"{_PREFIX}_cache_requests_total"
+            lines.append(f"# HELP {name} Cache lookups by cache and result")
+            lines.append(f"# TYPE {name} counter")
+            for (cache, result), value in sorted(self.caches.items()):
+                lines.append(f"{name}{_labels(('cache', 'result'), (cache, result))} {value}")
+            return "\n".join(lines) + "\n"
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histograms(lines, metric, help_text, label_names, histograms):
+    name = f"{_PREFIX}_{metric}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for label_values, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + (float("inf"),), histogram.counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket_labels = _labels(label_names, label_values, 'le="%s"' % le)
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{name}_sum{_labels(label_names, label_values)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(label_names, label_values)} {histogram.count}")
+
+
+REGISTRY = Registry()
+
+
+def observe(stage, seconds):
+    """Records one occurrence of stage that took the given time."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.stages.append((stage, seconds))
+    else:
+        standalone = Recorder()
+        standalone.stages.append((stage, seconds))
+        REGISTRY.record(standalone)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one occurrence of stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def count(cache, hit):
+    """Records one lookup of cache as a hit (True), miss (False) or a named result."""
+    result = ("hit" if hit else "miss") if isinstance(hit, bool) else hit
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.caches.append((cache, result))
+    else:
+        standalone = Recorder()
+        standalone.caches.append((cache, result))
+        REGISTRY.record(standalone)
+
+
+def collect(fn, *args, **kwargs):
+    """
+    Runs fn under a fresh Recorder (in an executor thread or process) and
+    returns (result, recorder) for merge() in the caller.
+    """
+    recorder = Recorder()
+    token = _current.set(recorder)
+    try:
+        return fn(*args, **kwargs), recorder
+    finally:
+        _current.reset(token)
+
+
+def bind(fn):
+    """
+    Wraps fn to run in a copy of the current context, so spans recorded in
+    threads that do not copy it themselves (joblib) reach the request.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+def merge(recorder):
+    """Adds spans recorded elsewhere (see collect) to the current request."""
+    current = _current.get()
+    if current is not None:
+        current.merge(recorder)
+    else:
+        REGISTRY.record(recorder)
+
+
+def _server_timing(recorder, total):
+    # Stages summed by name, in first-seen order, then cache results and the total
+    durations = {}
+    for stage, seconds in recorder.stages:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in durations.items()]
+    results = {}
+    for cache, result in recorder.caches:
+        results.setdefault(cache, result)
+    entries.extend(f'{cache};desc="{result}"' for cache, result in results.items())
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that gives each HTTP request a Recorder, adds the
+    Server-Timing header and records the request latency by route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = Recorder()
+        token = _current.set(recorder)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                timing = _server_timing(recorder, time.perf_counter() - start)
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            REGISTRY.observe_request(endpoint, scope["method"], status, time.perf_counter() - start)
+            REGISTRY.record(recorder)
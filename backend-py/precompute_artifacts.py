@@ -0,0 +1,85 @@
+"""
+Batch job that precomputes API responses into the artifact store.
+
+Enumerates the practical parameter space of the merged_df endpoints, renders
+every response with the same view functions the API uses and writes the
+bodies under precompute/artifacts/<dataset version>-<source version>/. The
+API serves these files directly while merged_df.csv and the code rendering
+them are unchanged.
+
+Usage:
+    python precompute_artifacts.py [--max-dimensions N] [--max-clusters K]
+                                   [--formats json,columnar] [--prune]
+"""
+import argparse
+import time
+
+import artifacts
+import snapshots
+import views
+from responses import COLUMNAR_MEDIA_TYPE, JSON_MEDIA_TYPE, render_view
+from services import load_merged_dataset
+
+# Endpoints that can also answer in the columnar binary format
+COLUMNAR_ENDPOINTS = ("biplot", "kmeans", "scatterplot_matrix", "mdp")
+
+
+def parameter_grid(max_dimensions, max_clusters):
+    """
+    Yields (endpoint, view, params) for every precomputed request. Params must
+    match what the handlers in main.py pass to serve_view.
+    """
+    dimension_range = range(1, max_dimensions + 1)
+    cluster_range = range(1, max_clusters + 1)
+
+    yield "eigenValues", views.eigen_values_view, {}
+    yield "biplot", views.biplot_view, {"dimensions": None}
+    yield "pca_loadings", views.pca_loadings_view, {"dimensions": None}
+    for dimensions in dimension_range:
+        yield "top_features", views.top_features_view, {"dimensions": dimensions}
+        yield "pca_loadings", views.pca_loadings_view, {"dimensions": dimensions}
+        for clusters in cluster_range:
+            yield "kmeans", views.kmeans_view, {"clusters": clusters, "dimensions": dimensions}
+            yield "scatterplot_matrix", views.scatterplot_matrix_view, {"dimensions": dimensions, "n_clusters": clusters}
+
+    mds_defaults = {"method": "auto", "landmarks": None, "silhouette_sample": None}
+    yield "mdp", views.mdp_view, dict(find_optimal=True, **mds_defaults)
+    for clusters in cluster_range:
+        yield "mdp", views.mdp_view, dict(clusters=clusters, find_optimal=False, **mds_defaults)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute API responses into the artifact store")
+    parser.add_argument("--max-dimensions", type=int, default=None, help="Highest PCA dimension count (defaults to every feature)")
+    parser.add_argument("--max-clusters", type=int, default=10, help="Highest number of clusters")
+    parser.add_argument("--formats", default="json,columnar", help="Comma-separated response formats to write")
+    parser.add_argument("--prune", action="store_true", help="Delete artifacts and model snapshots of other dataset or code versions")
+    args = parser.parse_args()
+
+    dataset = load_merged_dataset()
+    version = dataset.version
+    max_dimensions = args.max_dimensions or len(dataset.data["featureNames"])
+    formats = {name.strip() for name in args.formats.split(",")}
+
+    start = time.perf_counter()
+    written = 0
+    for endpoint, view, params in parameter_grid(max_dimensions, args.max_clusters):
+        media_types = []
+        if "json" in formats:
+            media_types.append(JSON_MEDIA_TYPE)
+        if "columnar" in formats and endpoint in COLUMNAR_ENDPOINTS:
+            media_types.append(COLUMNAR_MEDIA_TYPE)
+        for media_type in media_types:
+            artifacts.save_artifact(version, endpoint, params, media_type, render_view(view, params, media_type))
+            written += 1
+
+    print(f"Wrote {written} artifacts for dataset {version} in {time.perf_counter() - start:.1f}s")
+    if args.prune:
+        removed = artifacts.prune(version)
+        print(f"Pruned {len(removed)} stale artifact versions")
+        removed = snapshots.prune(version)
+        print(f"Pruned {len(removed)} stale model snapshot sets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+On-demand profiling of single requests.
+
+With ANALYTICS_PROFILING=on, a request to a view endpoint that carries an
+`X-Profile` header or a `profile` query parameter is run under cProfile and
+tracemalloc in the worker that computes it:
+
+    X-Profile: 1      (or ?profile=1)     profile the request as it is served,
+                                          reusing memoized fits
+    X-Profile: cold   (or ?profile=cold)  recompute every memoized fit, as
+                                          the first request after a restart
+
+Profiled requests skip the HTTP body cache, precomputed artifacts and request
+coalescing so the view really runs. The response is the normal body plus an
+X-Profile-Id header (the X-Request-ID sent by the client, or a generated id).
+The report is stored under PROFILE_DIR and served by GET /profiles/<id>:
+
+    <id>.json   wall and CPU time, peak traced allocation and the call tree of
+                the view, pruned to calls taking at least PROFILE_MIN_FRACTION
+                of the total
+    <id>.prof   raw cProfile stats, for pstats or snakeviz
+
+Only the thread running the view is profiled; work joblib hands to other
+threads shows up as time spent waiting in Parallel. tracemalloc counts every
+allocation in the process, so on the thread pool a concurrent request can
+raise the peak. When profiling is off, checking a request costs one comparison.
+
+Configuration (environment variables):
+    ANALYTICS_PROFILING         "on" to honour profile requests (default: off)
+    ANALYTICS_PROFILE_DIR       where reports are written
+                                (default: precompute/profiles)
+    ANALYTICS_PROFILE_KEEP      reports kept before the oldest are removed
+                                (default: 50)
+"""
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from datastore import BASE_DIR, recomputing
+
+ENABLED = os.environ.get("ANALYTICS_PROFILING", "off").lower() == "on"
+PROFILE_DIR = os.environ.get("ANALYTICS_PROFILE_DIR", os.path.join(BASE_DIR, "precompute", "profiles"))
+PROFILE_KEEP = int(os.environ.get("ANALYTICS_PROFILE_KEEP", "50"))
+
+# Calls below this share of the view's time are left out of the call tree
+PROFILE_MIN_FRACTION = 0.01
+PROFILE_MAX_DEPTH = 40
+
+_MODES = {"1": "warm", "true": "warm", "warm": "warm", "cold": "cold"}
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# cProfile and tracemalloc are process-wide switches; profile one request at a time
+_lock = threading.Lock()
+
+
+def requested(request):
+    """
+    Returns the profiling mode ("warm" or "cold") a request asks for, or None
+    when it asks for none or profiling is disabled.
+    """
+    if not ENABLED:
+        return None
+    value = request.headers.get("x-profile") or request.query_params.get("profile")
+    if value is None:
+        return None
+    return _MODES.get(value.strip().lower())
+
+
+def request_id(request):
+    """The client's X-Request-ID when it is a safe file name, else a new id."""
+    candidate = request.headers.get("x-request-id", "")
+    return candidate if _REQUEST_ID.match(candidate) else uuid.uuid4().hex
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _call_tree(stats, func, calls, own, cumulative, total, depth=0, path=()):
+    node = {
+        "function": _label(func),
+        "calls": calls,
+        "ownMs": round(own * 1000, 3),
+        "cumulativeMs": round(cumulative * 1000, 3)
+    }
+    if depth >= PROFILE_MAX_DEPTH or func in path:
+        return node
+    # Per-edge stats: time spent in each callee when called from func
+    callees = sorted(stats.all_callees.get(func, {}).items(), key=lambda item: item[1][3], reverse=True)
+    children = [
+        _call_tree(stats, callee, edge[0], edge[2], edge[3], total, depth + 1, path + (func,))
+        for callee, edge in callees
+        if edge[3] >= total * PROFILE_MIN_FRACTION
+    ]
+    if children:
+        node["children"] = children
+    return node
+
+
+def _prune():
+    # Oldest reports first, until PROFILE_KEEP remain
+    reports = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in reports[:max(len(reports) - PROFILE_KEEP, 0)]:
+        for extension in (".json", ".prof"):
+            try:
+                os.remove(entry.path[:-len(".json")] + extension)
+            except FileNotFoundError:
+                pass
+
+
+def run(request_id, mode, endpoint, params, fn, *args, **kwargs):
+    """
+    Calls fn under cProfile and tracemalloc, writes the report and returns
+    (fn's result, report summary). Meant to be run on the compute executor.
+    """
+    with _lock:
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            if mode == "cold":
+                with recomputing():
+                    result = profiler.runcall(fn, *args, **kwargs)
+            else:
+                result = profiler.runcall(fn, *args, **kwargs)
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            if not tracing:
+                tracemalloc.stop()
+
+    stats = pstats.Stats(profiler)
+    stats.calc_callees()
+    root = (fn.__code__.co_filename, fn.__code__.co_firstlineno, fn.__code__.co_name)
+    _, calls, own, cumulative, _ = stats.stats[root]
+
+    summary = {
+        "requestId": request_id,
+        "endpoint": endpoint,
+        "params": params,
+        "mode": mode,
+        "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "pid": os.getpid(),
+        "wallMs": round(wall * 1000, 3),
+        "cpuMs": round(cpu * 1000, 3),
+        "peakBytes": peak
+    }
+    report = dict(summary, callTree=_call_tree(stats, root, calls, own, cumulative, cumulative))
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{request_id}.prof"))
+    with open(os.path.join(PROFILE_DIR, f"{request_id}.json"), "w") as f:
+        json.dump(report, f, default=list)
+    _prune()
+    return result, summary
+
+
+def load_report(request_id):
+    """Returns a stored report, or None when there is none under that id."""
+    if not _REQUEST_ID.match(request_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{request_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,234 @@
+"""
+Response classes for the API endpoints.
+
+Service results are serialized exactly once, by orjson, straight from the
+NumPy arrays and DataFrames the services return. Arrays are encoded natively,
+DataFrames become lists of row records, and NaN/inf become null.
+
+Point-heavy endpoints can also answer in a compact columnar binary format when
+the client sends `Accept: application/vnd.cse564.columnar`:
+
+    b"COL1" | uint32 LE header length | header JSON | buffers
+
+The header JSON is padded with spaces so the buffer region starts on an
+8-byte boundary. It holds the response document, in which every numeric array
+is replaced by {"$buffer": i} and every DataFrame by
+{"$table": {"length": n, "columns": {name: {"$buffer": i} or [values]}}}.
+"buffers"[i] gives the dtype, shape, offset (relative to the buffer region)
+and byteLength of each little-endian typed array, so a browser can wrap it in
+a Float32Array/Int32Array view without parsing. Floats are sent as float32 and
+integers as int32 unless their values do not fit.
+"""
+import struct
+
+import numpy as np
+import orjson
+import pandas as pd
+from starlette.responses import Response
+
+import metrics
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.cse564.columnar"
+_COLUMNAR_MAGIC = b"COL1"
+_ALIGNMENT = 8
+_FLOAT32_MAX = float(np.finfo(np.float32).max)
+_INT32_INFO = np.iinfo(np.int32)
+
+
+def _default(obj):
+    # Called by orjson for anything it cannot encode natively
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict(orient="records")
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return obj.tolist()
+    if isinstance(obj, np.ndarray):
+        # orjson only encodes C-contiguous arrays of numeric/bool dtype
+        if obj.dtype == object or obj.dtype.kind in "USM":
+            return obj.tolist()
+        return np.ascontiguousarray(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, range):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content):
+    """Serializes a service result to JSON bytes."""
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, with native NumPy/pandas support."""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _compact_array(values):
+    # Narrow to float32/int32 without a per-element pass unless it loses range
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        return values.astype("<i4")
+    if values.dtype.kind in "iu":
+        if values.size and (values.min() < _INT32_INFO.min or values.max() > _INT32_INFO.max):
+            return values.astype("<f8")
+        return values.astype("<i4")
+    finite = values[np.isfinite(values)]
+    if finite.size and np.abs(finite).max() > _FLOAT32_MAX:
+        return values.astype("<f8")
+    return values.astype("<f4")
+
+
+def _is_numeric(values):
+    return values.dtype.kind in "biuf"
+
+
+class _ColumnarEncoder:
+    def __init__(self):
+        self.buffers = []
+        self.specs = []
+        self.offset = 0
+
+    def add_buffer(self, values):
+        data = np.ascontiguousarray(_compact_array(values))
+        self.specs.append({
+            "dtype": data.dtype.name,
+            "shape": list(data.shape),
+            "offset": self.offset,
+            "byteLength": data.nbytes
+        })
+        self.buffers.append(data)
+        self.offset += data.nbytes + (-data.nbytes % _ALIGNMENT)
+        return {"$buffer": len(self.specs) - 1}
+
+    def encode(self, obj):
+        if isinstance(obj, dict):
+            return {key: self.encode(value) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [self.encode(value) for value in obj]
+        if isinstance(obj, pd.DataFrame):
+            columns = {}
+            for name in obj.columns:
+                values = obj[name].to_numpy()
+                columns[str(name)] = self.add_buffer(values) if _is_numeric(values) else values.tolist()
+            return {"$table": {"length": len(obj), "columns": columns}}
+        if isinstance(obj, np.ndarray) and _is_numeric(obj):
+            return self.add_buffer(obj)
+        return obj
+
+
+def encode_columnar(content):
+    """Encodes a service result in the columnar binary format described above."""
+    encoder = _ColumnarEncoder()
+    document = encoder.encode(content)
+    header = dumps({"document": document, "buffers": encoder.specs})
+
+    prefix_length = len(_COLUMNAR_MAGIC) + 4
+    header += b" " * (-(prefix_length + len(header)) % _ALIGNMENT)
+
+    parts = [_COLUMNAR_MAGIC, struct.pack("<I", len(header)), header]
+    for data in encoder.buffers:
+        parts.append(data.tobytes())
+        parts.append(b"\0" * (-data.nbytes % _ALIGNMENT))
+    return b"".join(parts)
+
+
+def decode_columnar(body):
+    """
+    Decodes a columnar body back into a document of NumPy arrays and dicts of
+    column arrays (used by Python clients and the benchmarks).
+    """
+    if body[:4] != _COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar response body")
+    (header_length,) = struct.unpack("<I", body[4:8])
+    header = orjson.loads(body[8:8 + header_length])
+    region = memoryview(body)[8 + header_length:]
+
+    def buffer(index):
+        spec = header["buffers"][index]
+        data = np.frombuffer(region, dtype=spec["dtype"], count=int(np.prod(spec["shape"])), offset=spec["offset"])
+        return data.reshape(spec["shape"])
+
+    def decode(obj):
+        if isinstance(obj, dict):
+            if set(obj) == {"$buffer"}:
+                return buffer(obj["$buffer"])
+            if set(obj) == {"$table"}:
+                return {name: decode(column) for name, column in obj["$table"]["columns"].items()}
+            return {key: decode(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [decode(value) for value in obj]
+        return obj
+
+    return decode(header["document"])
+
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _accepted_ranges(accept):
+    # Media range -> q-value of an Accept header
+    ranges = {}
+    for item in accept.split(","):
+        media_range, *options = item.split(";")
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for option in options:
+            name, _, value = option.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_range] = quality
+    return ranges
+
+
+def _quality(ranges, media_type):
+    # The q-value of the most specific range matching media_type, 0 when none does
+    for media_range in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+        if media_range in ranges:
+            return ranges[media_range]
+    return 0.0
+
+
+def negotiate_media_type(request):
+    """
+    Returns the columnar media type if the client names it in Accept with a
+    q-value above zero and at least that of JSON, JSON otherwise. Wildcards
+    never select the binary format.
+    """
+    ranges = _accepted_ranges(request.headers.get("accept", ""))
+    columnar = ranges.get(COLUMNAR_MEDIA_TYPE, 0.0)
+    if columnar > 0 and columnar >= _quality(ranges, JSON_MEDIA_TYPE):
+        return COLUMNAR_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def render(content, media_type=JSON_MEDIA_TYPE):
+    """Serializes a service result to bytes in the given media type."""
+    with metrics.span("serialize"):
+        if media_type == COLUMNAR_MEDIA_TYPE:
+            return encode_columnar(content)
+        if media_type == NDJSON_MEDIA_TYPE:
+            # One newline-terminated document per streamed line
+            return dumps(content) + b"\n"
+        return dumps(content)
+
+
+def render_view(view, params, media_type=JSON_MEDIA_TYPE):
+    """
+    Runs a view and serializes its result, so callers in another process only
+    receive the response body.
+    """
+    with metrics.span("view"):
+        content = view(**params)
+    return render(content, media_type)
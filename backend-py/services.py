@@ -2,19 +2,149 @@ import pandas as pd
 import numpy as np
 import os
 import json
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.manifold import MDS
-from sklearn.preprocessing import StandardScaler
-from scipy.spatial.distance import pdist, squareform
-from sklearn.metrics import silhouette_score
-from sklearn.preprocessing import LabelEncoder 
-def perform_pca():
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
+# sklearn, scipy and joblib are imported where they are used: they take longer
+# to import than everything else together, and API-only processes (and workers
+# answering from snapshots or file-backed views) never need them
+from datastore import DATA_DIR, get_dataset
+import geo
+import matrixcache
+import metrics
+import outofcore
+import snapshots
+
+MERGED_DF_PATH = os.path.join(DATA_DIR, "merged_df.csv")
+SUNBURST_DF_PATH = os.path.join(DATA_DIR, "sunburst_df.csv")
+CRIME_DATA_PATH = os.path.join(DATA_DIR, "nyc_crime_by_hour.csv")
+NTA_GEOJSON_PATH = os.path.join(DATA_DIR, "NTA.geo.json")
+BOROUGH_GEOJSON_PATH = os.path.join(DATA_DIR, "borough.geo.json")
+
+# k values fitted for the elbow chart and the number of parallel jobs used to fit them
+ELBOW_K_RANGE = range(1, 11)
+KMEANS_N_JOBS = int(os.environ.get("KMEANS_N_JOBS", "-1"))
+
+# Data MDS: "auto" runs SMACOF up to this many rows and classical MDS above it
+MDS_METHODS = ("auto", "smacof", "classical", "landmark")
+MDS_SMACOF_MAX_ROWS = int(os.environ.get("MDS_SMACOF_MAX_ROWS", "2000"))
+MDS_LANDMARKS = int(os.environ.get("MDS_LANDMARKS", "300"))
+# Landmark MDS builds a landmarks x landmarks matrix; more than this many are clamped
+MDS_MAX_LANDMARKS = int(os.environ.get("MDS_MAX_LANDMARKS", "2000"))
+MDS_CHUNK_ROWS = 10000
+MDS_STRESS_SAMPLE = 1000
+
+# Candidate k values for /mdp?find_optimal=true and the rows sampled per silhouette score
+OPTIMAL_K_RANGE = range(2, 11)
+SILHOUETTE_SAMPLE_SIZE = int(os.environ.get("SILHOUETTE_SAMPLE_SIZE", "5000"))
+
+# Default row count of /pdp?mode=sample; parallel coordinates stop being readable well before this
+PCP_SAMPLE_SIZE = 10000
+
+# Largest request parameters the services accept (the routes declare the same
+# bounds); KMeans k is capped so a request cannot ask for one cluster per row
+MAX_CLUSTERS = int(os.environ.get("ANALYTICS_MAX_CLUSTERS", "50"))
+SCATTERPLOT_MAX_BINS = 512
+PCP_MAX_BINS = 256
+SUNBURST_MAX_DEPTH = 3
+SILHOUETTE_MIN_SAMPLE = 10
+
+# merged_df files at least this large are processed out of core (chunked streaming
+# moments, IncrementalPCA, MiniBatchKMeans); ANALYTICS_OUT_OF_CORE=on/off forces a mode
+OUT_OF_CORE = os.environ.get("ANALYTICS_OUT_OF_CORE", "auto")
+OUT_OF_CORE_MIN_BYTES = int(os.environ.get("ANALYTICS_OUT_OF_CORE_MIN_BYTES", str(2 << 30)))
+OUT_OF_CORE_CHUNK_ROWS = int(os.environ.get("ANALYTICS_OUT_OF_CORE_CHUNK_ROWS", "100000"))
+
+# PCA solver: "auto" fits the full decomposition unless merged_df has at least
+# PCA_TRUNCATE_MIN_FEATURES features and at most a quarter of them are needed, in
+# which case only the leading components are fitted with the randomized solver.
+# "full", "randomized" and "arpack" force a solver. A truncated fit keeps at least
+# PCA_COMPONENTS components; more power iterations and oversamples make the
+# randomized solver more accurate, and a smaller PCA_ARPACK_TOL makes ARPACK so
+# (0 is machine precision).
+PCA_SOLVERS = ("auto", "full", "randomized", "arpack")
+PCA_SOLVER = os.environ.get("ANALYTICS_PCA_SOLVER", "auto")
+PCA_TRUNCATE_MIN_FEATURES = int(os.environ.get("ANALYTICS_PCA_TRUNCATE_MIN_FEATURES", "100"))
+PCA_COMPONENTS = int(os.environ.get("ANALYTICS_PCA_COMPONENTS", "10"))
+PCA_POWER_ITERATIONS = int(os.environ.get("ANALYTICS_PCA_POWER_ITERATIONS", "7"))
+PCA_OVERSAMPLES = int(os.environ.get("ANALYTICS_PCA_OVERSAMPLES", "10"))
+PCA_ARPACK_TOL = float(os.environ.get("ANALYTICS_PCA_ARPACK_TOL", "0"))
+
+# Share the parsed merged_df between worker processes through memory-mapped .npy files
+MATRIX_CACHE = os.environ.get("ANALYTICS_MATRIX_CACHE", "on") != "off"
+
+# Memoized fits of merged_df persisted for other workers and restarts (see snapshots.py)
+SNAPSHOT_KINDS = ("pca", "kmeans", "splom_kmeans", "mds", "optimal_k")
+_SNAPSHOT = snapshots.Snapshot(SNAPSHOT_KINDS) if snapshots.ENABLED else None
+
+# Simplification tolerance in degrees of each map geometry level; 0 keeps full precision
+GEO_LEVEL_TOLERANCES = (0.0, 0.0001, 0.0005, 0.002)
+
+
+class InvalidParameter(ValueError):
+    """A request parameter the services cannot honour (reported as 422, see views.error_status)."""
+
+
+class UnsupportedInMode(RuntimeError):
+    """A service the current data mode cannot provide (reported as 501, see views.error_status)."""
+
+
+def response_settings():
+    """
+    Returns the environment settings above that change what a response
+    contains, so cached bodies rendered under other settings are told apart
+    (see artifacts.SOURCE_VERSION).
+    """
+    return {
+        "mdsSmacofMaxRows": MDS_SMACOF_MAX_ROWS,
+        "mdsLandmarks": MDS_LANDMARKS,
+        "mdsMaxLandmarks": MDS_MAX_LANDMARKS,
+        "silhouetteSampleSize": SILHOUETTE_SAMPLE_SIZE,
+        "outOfCore": OUT_OF_CORE,
+        "outOfCoreMinBytes": OUT_OF_CORE_MIN_BYTES,
+        "outOfCoreChunkRows": OUT_OF_CORE_CHUNK_ROWS,
+        "pcaSolver": PCA_SOLVER,
+        "pcaTruncateMinFeatures": PCA_TRUNCATE_MIN_FEATURES,
+        "pcaComponents": PCA_COMPONENTS,
+        "pcaPowerIterations": PCA_POWER_ITERATIONS,
+        "pcaOversamples": PCA_OVERSAMPLES,
+        "pcaArpackTol": PCA_ARPACK_TOL
+    }
+
+
+def _check_range(name, value, low, high=None):
+    """
+    Checks a numeric request parameter against the bounds the routes declare,
+    so views computed without a route (see batch.py) are held to them too.
+
+    Raises:
+        InvalidParameter: when value is below low or above high
+    """
+    if value < low or (high is not None and value > high):
+        bounds = f"at least {low}" if high is None else f"between {low} and {high}"
+        raise InvalidParameter(f"{name} must be {bounds}, got {value}")
+
+
+def _check_choice(name, value, choices):
+    """
+    Raises:
+        InvalidParameter: when value is not one of choices
+    """
+    if value not in choices:
+        raise InvalidParameter(f"Unknown {name} '{value}', expected one of {choices}")
+
+
+def _use_out_of_core(path):
+    if OUT_OF_CORE == "auto":
+        return os.path.getsize(path) >= OUT_OF_CORE_MIN_BYTES
+    return OUT_OF_CORE == "on"
+
+
+def _read_merged_df(path):
+    """
+    Parses merged_df.csv and prepares the matrices shared by the analytics
+    services: the raw frame, its numeric columns without NaNs and their
+    standardized values.
+    """
+    with metrics.span("csv_parse"):
+        merged_df = pd.read_csv(path)
     numeric_df = merged_df.select_dtypes(include=[np.number])
 
     # Dropping any columns with NaN values
@@ -25,23 +155,221 @@ def perform_pca():
         numeric_df[col] = numeric_df[col].dt.total_seconds()
 
     # Standardizing the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    with metrics.span("scale"):
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler()
+        scaled_data = scaler.fit_transform(numeric_df)
 
-    # Performing PCA
+    return {
+        "raw": merged_df,
+        "numeric": numeric_df,
+        "scaled": scaled_data,
+        "scaler": scaler,
+        "featureNames": numeric_df.columns.tolist()
+    }
+
+
+def _load_merged_df(path):
+    """
+    Loads the merged_df matrices, from the memory-mapped matrix cache unless
+    it is disabled (see matrixcache.py).
+
+    In out-of-core mode only the feature names and their streaming mean and
+    variance are kept; the PCA and KMeans services then read the file in
+    chunks (see outofcore.py).
+    """
+    if _use_out_of_core(path):
+        moments = outofcore.streaming_moments(path, OUT_OF_CORE_CHUNK_ROWS)
+        return {
+            "outOfCore": True,
+            "path": path,
+            "moments": moments,
+            "featureNames": moments["featureNames"]
+        }
+
+    if MATRIX_CACHE:
+        data = matrixcache.load(path, _read_merged_df)
+    else:
+        data = _read_merged_df(path)
+    data["outOfCore"] = False
+    return data
+
+
+def load_merged_dataset():
+    """
+    Returns the process-wide merged_df dataset, parsing the CSV only when it
+    has not been loaded yet or its content changed on disk.
+    """
+    return get_dataset(MERGED_DF_PATH, _load_merged_df, _SNAPSHOT)
+
+
+def warm_worker():
+    """
+    Runs once in every new compute worker process: imports the model
+    libraries and opens merged_df, so the worker's first request starts
+    computing right away. Fitted models are restored from snapshots on first
+    use, not here.
+    """
+    try:
+        import joblib, scipy.spatial.distance, sklearn.cluster, sklearn.decomposition, sklearn.manifold, sklearn.metrics  # noqa: F401
+        load_merged_dataset()
+    except Exception as e:
+        # A worker that fails to warm up still serves requests
+        print(f"Worker warm-up failed: {e}")
+
+
+def _in_memory(dataset):
+    """
+    Returns the loaded merged_df matrices for services that need every row in
+    memory, which the out-of-core mode does not provide.
+
+    Raises:
+        UnsupportedInMode: in out-of-core mode
+    """
+    if dataset.data["outOfCore"]:
+        raise UnsupportedInMode(
+            "This view needs merged_df in memory; only PCA, loadings and KMeans "
+            "support ANALYTICS_OUT_OF_CORE mode"
+        )
+    return dataset.data
+
+
+def _fit_full_pca(scaled_data):
+    from sklearn.decomposition import PCA
     pca = PCA()
-    pca.fit(scaled_data)
+    scores = pca.fit_transform(scaled_data)
+    return {"pca": pca, "scores": scores}
+
+
+def _fit_truncated_pca(scaled_data, solver, n_components):
+    from sklearn.decomposition import PCA
+    # explained_variance_ratio_ is still relative to the total variance of every feature
+    pca = PCA(
+        n_components=n_components, svd_solver=solver, random_state=42, tol=PCA_ARPACK_TOL,
+        iterated_power=PCA_POWER_ITERATIONS, n_oversamples=PCA_OVERSAMPLES
+    )
+    scores = pca.fit_transform(scaled_data)
+    return {"pca": pca, "scores": scores}
+
+
+def _pca_solver(n_samples, n_features, n_components):
+    if PCA_SOLVER not in PCA_SOLVERS:
+        raise ValueError(f"Unknown PCA solver '{PCA_SOLVER}', expected one of {PCA_SOLVERS}")
+    # Truncated solvers need fewer components than min(rows, features)
+    if PCA_SOLVER == "full" or n_components >= min(n_samples, n_features):
+        return "full"
+    if PCA_SOLVER != "auto":
+        return PCA_SOLVER
+    if n_features >= PCA_TRUNCATE_MIN_FEATURES and n_components <= n_features // 4:
+        return "randomized"
+    return "full"
+
+
+def _pca_dimensions(dimensions, n_features):
+    """
+    Returns the number of leading components a request selects (None for
+    all), clamped to the number of features.
+
+    Raises:
+        InvalidParameter: when dimensions is below 1
+    """
+    if dimensions is None:
+        return None
+    _check_range("dimensions", dimensions, 1)
+    return min(dimensions, n_features)
+
+
+def _truncated_pca_model(dataset, scaled_data, solver, n_components):
+    # The largest cached fit of this solver with enough components is sliced,
+    # so asking for more components only refits when no fit covers them
+    covering = [
+        key[2] for key in dataset.memoized_keys()
+        if isinstance(key, tuple) and len(key) == 3 and key[:2] == ("pca", solver) and key[2] >= n_components
+    ]
+    fitted = max(covering, default=n_components)
+    return dataset.memoize(("pca", solver, fitted), lambda: _fit_truncated_pca(scaled_data, solver, fitted))
+
+
+def get_pca_model(n_components=None, scores=True):
+    """
+    Returns the leading principal components of the standardized merged_df
+    matrix. Each fit is done once per dataset version and every smaller model
+    is a slice of it, so changing the number of dimensions rarely triggers a
+    refit.
+
+    Narrow matrices get the full decomposition. For wide ones (see
+    PCA_SOLVER) only the leading max(n_components, PCA_COMPONENTS) components
+    are fitted, unless a larger truncated fit is already cached, which is
+    sliced instead. The variance left out is reported as the tail.
+
+    Args:
+        n_components (int, optional): Number of leading components (defaults to
+            all, or to the PCA_COMPONENTS a truncated fit keeps)
+        scores (bool): Whether the PC scores are needed. Out of core they are
+            projected from the file, so callers that only use the components
+            pass False and get None.
+
+    Returns:
+        dict: components, explained variance (absolute and ratio), PC scores,
+            the solver used and the share of variance (and number of
+            components) beyond the returned ones
+    """
+    dataset = load_merged_dataset()
+    data = dataset.data
+    n_features = len(data["featureNames"])
+    n_components = _pca_dimensions(n_components, n_features)
+    if data["outOfCore"]:
+        solver = "incremental"
+        # Keyed apart from the in-memory fits, which hold a different value (and snapshot)
+        pca = dataset.memoize(
+            ("pca", "incremental"), lambda: outofcore.fit_incremental_pca(data["path"], data["moments"], OUT_OF_CORE_CHUNK_ROWS)
+        )
+        pc_scores = None
+        if scores:
+            k = len(pca.components_[:n_components])
+            pc_scores = dataset.memoize(
+                ("pca_scores", k), lambda: outofcore.project(data["path"], data["moments"], pca, k, OUT_OF_CORE_CHUNK_ROWS)
+            )
+    else:
+        scaled = data["scaled"]
+        fitted = max(PCA_COMPONENTS if n_components is None else n_components, PCA_COMPONENTS)
+        solver = _pca_solver(scaled.shape[0], n_features, fitted)
+        if solver == "full":
+            model = dataset.memoize("pca", lambda: _fit_full_pca(scaled))
+        else:
+            model = _truncated_pca_model(dataset, scaled, solver, fitted)
+        pca = model["pca"]
+        pc_scores = model["scores"][:, :n_components]
+
+    ratio = pca.explained_variance_ratio_[:n_components]
+    return {
+        "components": pca.components_[:n_components],
+        "explainedVariance": pca.explained_variance_[:n_components],
+        "explainedVarianceRatio": ratio,
+        "scores": pc_scores,
+        "solver": solver,
+        "tailVarianceRatio": max(0.0, 1.0 - float(ratio.sum())),
+        "tailComponents": n_features - len(ratio)
+    }
+
+
+def perform_pca():
+    dataset = load_merged_dataset().data
+
+    # PCA fit shared with the other PCA-derived services (all components unless truncated)
+    pca = get_pca_model(scores=False)
 
     # Convert NumPy arrays to Python lists for JSON serialization
-    eigenvectors = pca.components_.tolist()
-    explained_variance = pca.explained_variance_.tolist()
-    explained_variance_ratio = pca.explained_variance_ratio_.tolist()
+    # NumPy arrays are serialized natively by the response layer
+    eigenvectors = pca["components"]
+    explained_variance = pca["explainedVariance"]
+    explained_variance_ratio = pca["explainedVarianceRatio"]
     
     # Calculate cumulative explained variance for Scree plot
-    cumulative_variance_ratio = np.cumsum(pca.explained_variance_ratio_).tolist()
+    cumulative_variance_ratio = np.cumsum(explained_variance_ratio)
     
     # Also return column names for reference
-    feature_names = numeric_df.columns.tolist()
+    feature_names = dataset["featureNames"]
 
     return {
         "eigenVectors": eigenvectors,
@@ -49,15 +377,19 @@ def perform_pca():
         "explainedVarianceRatio": explained_variance_ratio,
         "cumulativeVarianceRatio": cumulative_variance_ratio,
         "featureNames": feature_names,
+        "solver": pca["solver"],
         "screeData": {
             "components": list(range(1, len(explained_variance_ratio) + 1)),
             "explainedVarianceRatio": explained_variance_ratio,
-            "cumulativeVarianceRatio": cumulative_variance_ratio
+            "cumulativeVarianceRatio": cumulative_variance_ratio,
+            # Variance of the components a truncated fit leaves out (0 for a full fit)
+            "tailVarianceRatio": pca["tailVarianceRatio"],
+            "tailComponents": pca["tailComponents"]
         }
     }
 
 
-def get_biplot_data(selected_dimensions=None):
+def _biplot_dimensions(selected_dimensions):
     # Default to first two dimensions if not specified
     if selected_dimensions is None:
         selected_dimensions = [0, 1, 2, 3, 4]
@@ -65,83 +397,89 @@ def get_biplot_data(selected_dimensions=None):
         selected_dimensions = list(range(min(selected_dimensions + 1, 5)))
     elif not isinstance(selected_dimensions, list):
         selected_dimensions = [0, 1, 2, 3, 4]
+    return selected_dimensions
 
-    # Get the base directory and construct absolute path to file
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
-    
-    numeric_df = merged_df.select_dtypes(include=[np.number])
-
-    # Dropping any columns with NaN values
-    numeric_df = numeric_df.dropna(axis=1)
 
-    # Convert timedelta columns to numerical (seconds)
-    for col in numeric_df.select_dtypes(include=['timedelta64']).columns:
-        numeric_df[col] = numeric_df[col].dt.total_seconds()
+def get_biplot_data(selected_dimensions=None):
+    selected_dimensions = _biplot_dimensions(selected_dimensions)
 
-    # Standardizing the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    dataset = _in_memory(load_merged_dataset())
+    numeric_df = dataset["numeric"]
 
-    # Performing PCA
-    pca = PCA()
-    pca_scores = pca.fit_transform(scaled_data)
-    loadings = pca.components_.T 
+    # Scores and loadings come from the shared full PCA fit
+    pca = get_pca_model()
+    pca_scores = pca["scores"]
+    loadings = pca["components"].T 
     feature_names = numeric_df.columns.tolist()
-    variance = pca.explained_variance_ratio_
+    variance = pca["explainedVarianceRatio"]
     
     # Generate point labels (can be customized)
     point_labels = [f"Point {i+1}" for i in range(len(pca_scores))]
     
-    # Create original data as a list of dictionaries
-    original_data = []
-    for i, row in enumerate(numeric_df.values):
-        data_point = {}
-        for j, feature in enumerate(feature_names):
-            data_point[feature] = row[j]
-        original_data.append(data_point)
+    # Original data is serialized as one record per row by the response layer
+    original_data = numeric_df
 
     biplot_data = {
-        "pcScores": pca_scores.tolist(),
-        "loadings": loadings.tolist(),
+        "pcScores": pca_scores,
+        "loadings": loadings,
         "featureNames": feature_names,
-        "variance": variance.tolist(),
+        "variance": variance,
         "selectedDimensions": selected_dimensions,
         "pointLabels": point_labels,
-        "originalData": original_data
+        "originalData": original_data,
+        "solver": pca["solver"],
+        "tailVarianceRatio": pca["tailVarianceRatio"]
     }
 
     return biplot_data
 
 
-def top_features(di):
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
-    numeric_df = merged_df.select_dtypes(include=[np.number])
+def get_biplot_header(selected_dimensions=None, offset=0, limit=None):
+    """
+    The part of the biplot that does not grow with the row count, for the
+    streamed /biplot variant, plus the row range [offset, stop) it will send.
+    """
+    pca = get_pca_model(scores=False)
+    row_count = len(_in_memory(load_merged_dataset())["numeric"])
+    start = min(offset, row_count)
+    stop = row_count if limit is None else min(start + limit, row_count)
+    return {
+        "loadings": pca["components"].T,
+        "featureNames": load_merged_dataset().data["featureNames"],
+        "variance": pca["explainedVarianceRatio"],
+        "solver": pca["solver"],
+        "tailVarianceRatio": pca["tailVarianceRatio"],
+        "selectedDimensions": _biplot_dimensions(selected_dimensions),
+        "rowCount": row_count,
+        "offset": start,
+        "stop": stop
+    }
 
-    # Dropping any columns with NaN values
-    numeric_df = numeric_df.dropna(axis=1)
 
-    # Convert timedelta columns to numerical (seconds)
-    for col in numeric_df.select_dtypes(include=['timedelta64']).columns:
-        numeric_df[col] = numeric_df[col].dt.total_seconds()
+def get_biplot_rows(start, stop):
+    """Rows start..stop-1 of the biplot's pcScores, pointLabels and originalData."""
+    pca = get_pca_model()
+    return {
+        "offset": start,
+        "pcScores": pca["scores"][start:stop],
+        "pointLabels": [f"Point {i+1}" for i in range(start, stop)],
+        "originalData": _in_memory(load_merged_dataset())["numeric"].iloc[start:stop]
+    }
 
-    # Standardizing the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
 
-    # Performing PCA
-    pca = PCA(n_components=di)  # Limit the components to <= di
-    pca.fit(scaled_data)
+def top_features(di):
+    dataset = load_merged_dataset().data
+    feature_names = np.asarray(dataset["featureNames"], dtype=object)
+    di = _pca_dimensions(di, len(feature_names))
+
+    # First di components of the shared PCA fit
+    pca = get_pca_model(di, scores=False)
 
     # Get the loadings (transpose components to get features in rows)
-    loadings = pca.components_.T  
+    loadings = pca["components"].T  
     
     # Weight loadings by explained variance for each component
-    weighted_loadings = loadings * np.sqrt(pca.explained_variance_)
+    weighted_loadings = loadings * np.sqrt(pca["explainedVariance"])
     
     # Sum of squared loadings for each feature
     squared_loadings = np.sum(weighted_loadings**2, axis=1)
@@ -150,7 +488,7 @@ def top_features(di):
     top_indices = np.argsort(squared_loadings)[-4:][::-1]
     
     # Get the feature names (column names) of the top 4 features
-    top_features = numeric_df.columns[top_indices].tolist()
+    top_features = feature_names[top_indices].tolist()
     
     return top_features
 
@@ -161,37 +499,27 @@ def get_pca_loadings(di):
     Returns the loadings (weights) of each feature on each principal component.
     
     Args:
-        di (int): Number of PCA dimensions to consider
+        di (int): Number of PCA dimensions to consider (None for all),
+            clamped to the number of features
         
     Returns:
         dict: Dictionary containing loadings and related data
-    """
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
-    numeric_df = merged_df.select_dtypes(include=[np.number])
 
-    # Dropping any columns with NaN values
-    numeric_df = numeric_df.dropna(axis=1)
-
-    # Convert timedelta columns to numerical (seconds)
-    for col in numeric_df.select_dtypes(include=['timedelta64']).columns:
-        numeric_df[col] = numeric_df[col].dt.total_seconds()
-
-    # Standardizing the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    Raises:
+        InvalidParameter: when di is below 1
+    """
+    dataset = load_merged_dataset().data
+    feature_names = np.asarray(dataset["featureNames"], dtype=object)
+    di = _pca_dimensions(di, len(feature_names))
 
-    # Performing PCA with specified number of components
-    pca = PCA(n_components=min(di, len(numeric_df.columns)))
-    pca.fit(scaled_data)
+    # First di components of the shared PCA fit
+    pca = get_pca_model(di, scores=False)
 
     # Get the loadings (transpose components to get features in rows)
-    loadings = pca.components_.T
+    loadings = pca["components"].T
     
     # Weight loadings by explained variance
-    weighted_loadings = loadings * np.sqrt(pca.explained_variance_)
+    weighted_loadings = loadings * np.sqrt(pca["explainedVariance"])
     
     # Calculate squared sum of loadings for each feature
     # Only use the first 'di' components
@@ -202,7 +530,7 @@ def get_pca_loadings(di):
     
     # Get top 4 features
     top_indices = sorted_indices[:4]
-    top_features = numeric_df.columns[top_indices].tolist()
+    top_features = feature_names[top_indices].tolist()
     top_loadings = squared_loadings[top_indices].tolist()
     
     # Create table data for frontend display
@@ -215,16 +543,109 @@ def get_pca_loadings(di):
         })
     
     return {
-        "allLoadings": loadings.tolist(),
-        "squaredLoadings": squared_loadings.tolist(),
-        "featureNames": numeric_df.columns.tolist(),
+        "allLoadings": loadings,
+        "squaredLoadings": squared_loadings,
+        "featureNames": dataset["featureNames"],
         "topFeatures": top_features,
         "topLoadingValues": top_loadings,
         "tableData": table_data,
-        "explainedVariance": pca.explained_variance_ratio_.tolist()
+        "explainedVariance": pca["explainedVarianceRatio"],
+        "solver": pca["solver"],
+        "tailVarianceRatio": pca["tailVarianceRatio"]
     }
 
-def get_scatterplot_matrix_data(dimensions=2, n_clusters=3):
+def _fit_feature_clusters(feature_data, n_clusters):
+    # KMeans on the standardized top features, as shown in the SPLOM
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(feature_data)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    return kmeans.fit_predict(scaled_features), kmeans.cluster_centers_
+
+
+def _hexbin(x, y, bins):
+    """
+    Assigns points already scaled to [0, bins] on both axes to pointy-top
+    hexagons whose width is one bin. Returns the column and row of each
+    point's hexagon and the function giving a hexagon's center.
+    """
+    dx = 1.0
+    dy = 1.5 / np.sqrt(3)
+    row = np.round(y / dy)
+    col = np.round(x / dx - (row % 2) / 2)
+    # Near the pointed edges the hexagon in the neighbouring row may be closer
+    offset = y / dy - row
+    other_row = row + np.sign(offset)
+    other_col = np.round(x / dx - (other_row % 2) / 2)
+
+    def center(c, r):
+        return (c + (r % 2) / 2) * dx, r * dy
+
+    cx, cy = center(col, row)
+    ox, oy = center(other_col, other_row)
+    use_other = (np.abs(offset) * 3 > 1) & ((x - ox) ** 2 + (y - oy) ** 2 < (x - cx) ** 2 + (y - cy) ** 2)
+    col = np.where(use_other, other_col, col).astype(np.int64)
+    row = np.where(use_other, other_row, row).astype(np.int64)
+    return col, row, center
+
+
+def _binned_scatterplot_matrix(feature_data, cluster_labels, n_clusters, bins, bin_shape):
+    """
+    Aggregates the SPLOM points: per-feature histograms by cluster for the
+    diagonal and, for every feature pair, 2D counts by cluster in square bins
+    or hexagons spanning bins cells across each axis.
+    """
+    features = list(feature_data.columns)
+    values = feature_data.to_numpy(dtype=float)
+    lows = np.nanmin(values, axis=0)
+    highs = np.nanmax(values, axis=0)
+    spans = np.where(highs > lows, highs - lows, 1.0)
+    # Position of every value in bin units, in [0, bins]
+    scaled = (values - lows) / spans * bins
+    bin_index = np.clip(np.floor(scaled), 0, bins - 1).astype(np.int64)
+    labels = np.asarray(cluster_labels, dtype=np.int64)
+
+    histograms = []
+    for i, feature in enumerate(features):
+        counts = np.bincount(labels * bins + bin_index[:, i], minlength=n_clusters * bins)
+        histograms.append({
+            "feature": feature,
+            "edges": np.linspace(lows[i], lows[i] + spans[i], bins + 1),
+            "counts": counts.reshape(n_clusters, bins)
+        })
+
+    pairs = []
+    for i in range(len(features)):
+        for j in range(i + 1, len(features)):
+            pair = {"x": features[i], "y": features[j]}
+            if bin_shape == "hex":
+                col, row, center = _hexbin(scaled[:, i], scaled[:, j], bins)
+                cells, counts = np.unique(np.column_stack([labels, col, row]), axis=0, return_counts=True)
+                cx, cy = center(cells[:, 1], cells[:, 2])
+                pair["cells"] = pd.DataFrame({
+                    "cluster": cells[:, 0],
+                    "x": lows[i] + cx / bins * spans[i],
+                    "y": lows[j] + cy / bins * spans[j],
+                    "count": counts
+                })
+            else:
+                flat = (labels * bins + bin_index[:, i]) * bins + bin_index[:, j]
+                pair["counts"] = np.bincount(flat, minlength=n_clusters * bins * bins).reshape(n_clusters, bins, bins)
+            pairs.append(pair)
+
+    return {
+        "binShape": bin_shape,
+        "bins": bins,
+        # Hexagon circumradius as a fraction of each axis' range
+        "hexRadius": 1 / (np.sqrt(3) * bins) if bin_shape == "hex" else None,
+        "rowCount": len(values),
+        "histograms": histograms,
+        "pairs": pairs
+    }
+
+
+def get_scatterplot_matrix_data(dimensions=2, n_clusters=3, mode="points", bins=32, bin_shape="square"):
     """
     Creates data for a scatterplot matrix of the top 4 features identified by PCA,
     including cluster assignments.
@@ -232,61 +653,50 @@ def get_scatterplot_matrix_data(dimensions=2, n_clusters=3):
     Args:
         dimensions (int): Number of PCA dimensions to consider for selecting top features
         n_clusters (int): Number of clusters to create
+        mode (str): "points" returns every row; "binned" returns per-pair 2D
+            counts and per-feature histograms by cluster instead
+        bins (int): Bins across each axis in the "binned" mode
+        bin_shape (str): "square" bins or "hex" hexagons in the "binned" mode
         
     Returns:
         dict: Data for scatterplot matrix including features, values, and cluster assignments
+
+    Raises:
+        InvalidParameter: for an out-of-range n_clusters or bins, or an unknown mode or bin_shape
     """
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
+    _check_range("n_clusters", n_clusters, 1, MAX_CLUSTERS)
+    _check_choice("mode", mode, ("points", "binned"))
+    _check_range("bins", bins, 2, SCATTERPLOT_MAX_BINS)
+    _check_choice("bin_shape", bin_shape, ("square", "hex"))
+    dataset = load_merged_dataset()
+    merged_df = _in_memory(dataset)["raw"]
     
     # Get the top 4 features based on PCA
     features = top_features(dimensions)
     
     # Extract only the top features from the dataframe
-    feature_data = merged_df[features].copy()
+    feature_data = merged_df[features]
     
-    # Perform clustering on these features
-    # Standardizing the feature data
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(feature_data)
-    
-    # Apply K-means clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    cluster_labels = kmeans.fit_predict(scaled_features)
+    # Perform clustering on these features (standardized K-means), once per dataset version
+    cluster_labels, cluster_centers = dataset.memoize(
+        ("splom_kmeans", tuple(features), n_clusters), lambda: _fit_feature_clusters(feature_data, n_clusters)
+    )
     
-    # Convert to appropriate format for frontend
-    result = {
-        "features": features,  # List of feature names
-        "data": [],  # Will contain data points
-        "clusterCenters": []  # Will contain cluster centers
-    }
-    
-    # Convert data to list of dictionaries (one per row)
-    for i, row in enumerate(feature_data.iterrows()):
-        _, row_data = row
-        data_point = {}
-        for feature in features:
-            value = row_data[feature]
-            # Convert numpy types to Python native types for JSON serialization
-            if isinstance(value, np.integer):
-                value = int(value)
-            elif isinstance(value, np.floating):
-                value = float(value)
-            data_point[feature] = value
-        
-        # Add cluster assignment
-        data_point["cluster"] = int(cluster_labels[i])
-        result["data"].append(data_point)
-    
-    # Add cluster centers
-    centers = kmeans.cluster_centers_
-    for i, center in enumerate(centers):
-        center_point = {"cluster": i}
-        for j, feature in enumerate(features):
-            center_point[feature] = float(center[j])
-        result["clusterCenters"].append(center_point)
+    # Data points and cluster centers are DataFrames that the response layer
+    # serializes as one record per row
+    centers = pd.DataFrame(cluster_centers, columns=features)
+    centers.insert(0, "cluster", np.arange(n_clusters))
+
+    result = {"features": features}  # List of feature names
+    if mode == "binned":
+        result["mode"] = mode
+        result.update(dataset.memoize(
+            ("splom_bins", tuple(features), n_clusters, bins, bin_shape),
+            lambda: _binned_scatterplot_matrix(feature_data, cluster_labels, n_clusters, bins, bin_shape)
+        ))
+    else:
+        result["data"] = feature_data.assign(cluster=cluster_labels)  # One point per row with its cluster
+    result["clusterCenters"] = centers
     
     # Calculate correlation matrix
     corr_matrix = feature_data.corr().to_dict(orient='index')
@@ -295,46 +705,75 @@ def get_scatterplot_matrix_data(dimensions=2, n_clusters=3):
     return result
 
 
-def perform_kmeans(n_clusters=3, dimensions=2):
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    merged_df = pd.read_csv(merged_df_path)
-    numeric_df = merged_df.select_dtypes(include=[np.number])
+def get_kmeans_model(n_clusters, dimensions=2):
+    """
+    Returns the KMeans model fitted on the first `dimensions` PC scores. Models
+    are cached per dataset version, dimensions and k, so the elbow curve and
+    the clustering shown to the user share the same fits.
 
-    # Dropping any columns with NaN values
-    numeric_df = numeric_df.dropna(axis=1)
+    Raises:
+        InvalidParameter: when n_clusters is outside 1..MAX_CLUSTERS
+    """
+    _check_range("clusters", n_clusters, 1, MAX_CLUSTERS)
+    dataset = load_merged_dataset()
+    # More dimensions than features select the same scores; keep them under one key
+    dimensions = _pca_dimensions(dimensions, len(dataset.data["featureNames"]))
 
-    # Convert timedelta columns to numerical (seconds)
-    for col in numeric_df.select_dtypes(include=['timedelta64']).columns:
-        numeric_df[col] = numeric_df[col].dt.total_seconds()
+    def fit():
+        pca_data = np.ascontiguousarray(get_pca_model(dimensions)["scores"])
+        if dataset.data["outOfCore"]:
+            return outofcore.fit_minibatch_kmeans(pca_data, n_clusters, OUT_OF_CORE_CHUNK_ROWS)
+        from sklearn.cluster import KMeans
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        kmeans.fit(pca_data)
+        return kmeans
 
-    # Standardizing the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    key = ("kmeans", dimensions, n_clusters)
+    if dataset.data["outOfCore"]:
+        key += ("minibatch",)
+    return dataset.memoize(key, fit)
 
-    # Performing PCA with the specified number of dimensions
-    pca = PCA(n_components=dimensions)
-    pca_data = pca.fit_transform(scaled_data)
 
-    # Using the Elbow Method to determine the best 'k' (still calculate this for the chart)
-    inertia = []
-    k_range = range(1, 11)  # Testing k from 1 to 10
+def get_elbow_models(dimensions=2):
+    """
+    Returns the KMeans models for every k of the elbow chart. On a cold cache
+    the missing k values are fitted in parallel (KMeans releases the GIL, so
+    threads keep the fitted models in this process's cache).
+    """
+    from joblib import Parallel, delayed
+    dimensions = _pca_dimensions(dimensions, len(load_merged_dataset().data["featureNames"]))
+    models = Parallel(n_jobs=KMEANS_N_JOBS, prefer="threads")(
+        delayed(metrics.bind(get_kmeans_model))(k, dimensions) for k in ELBOW_K_RANGE
+    )
+    return dict(zip(ELBOW_K_RANGE, models))
 
-    for k in k_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        kmeans.fit(pca_data)
-        inertia.append(kmeans.inertia_)
 
-    # Use the n_clusters passed from the frontend
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    cluster_labels = kmeans.fit_predict(pca_data)
+def get_cluster_labels(n_clusters=3, dimensions=2):
+    """Returns only the cluster labels for k clusters, without the elbow curve."""
+    return get_kmeans_model(n_clusters, dimensions).labels_
+
+
+def perform_kmeans(n_clusters=3, dimensions=2):
+    dimensions = _pca_dimensions(dimensions, len(load_merged_dataset().data["featureNames"]))
+    # PCA scores for the requested number of dimensions, sliced from the shared fit
+    pca_data = get_pca_model(dimensions)["scores"]
+
+    # Using the Elbow Method to determine the best 'k' (still calculate this for the chart)
+    elbow_models = get_elbow_models(dimensions)
+    inertia = [elbow_models[k].inertia_ for k in ELBOW_K_RANGE]
+
+    # Use the n_clusters passed from the frontend, reusing the elbow fit when it has one
+    if n_clusters in elbow_models:
+        kmeans = elbow_models[n_clusters]
+    else:
+        kmeans = get_kmeans_model(n_clusters, dimensions)
+    cluster_labels = kmeans.labels_
 
     return {
-        "pcaData": pca_data.tolist(),  # PCA-transformed data
-        "clusterLabels": cluster_labels.tolist(),  # Assigned cluster for each point
+        "pcaData": pca_data,  # PCA-transformed data
+        "clusterLabels": cluster_labels,  # Assigned cluster for each point
         "elbowData": {
-            "kValues": list(k_range),
+            "kValues": list(ELBOW_K_RANGE),
             "inertia": inertia
         },
         "optimalK": n_clusters,  # Return the user-specified k
@@ -342,192 +781,450 @@ def perform_kmeans(n_clusters=3, dimensions=2):
     }
 
 
-def compute_mds_json(cluster_labels=None, find_optimal=False):
+def _smacof_mds(scaled_data):
+    # Metric SMACOF on the dense n x n distance matrix: O(n^2) memory and time
+    from scipy.spatial.distance import pdist, squareform
+    from sklearn.manifold import MDS
+    data_dist = squareform(pdist(scaled_data, metric='euclidean'))
+    mds_data = MDS(n_components=2, dissimilarity='precomputed', random_state=42)
+    return mds_data.fit_transform(data_dist)
+
+
+def _classical_mds():
+    # Classical (Torgerson) MDS double-centers the squared Euclidean distances of
+    # the standardized data; the top eigenvectors of that Gram matrix are exactly
+    # the first two PC scores, so the shared PCA fit gives the embedding with
+    # O(n * features) memory instead of O(n^2).
+    return np.array(get_pca_model(2)["scores"])
+
+
+def _landmark_mds(scaled_data, n_landmarks):
+    # Landmark MDS (de Silva & Tenenbaum): classical MDS on a random subset of
+    # landmarks, then every point is placed by distance-based triangulation
+    # against those landmarks. Memory is bounded by landmarks x chunk rows.
+    n_rows = len(scaled_data)
+    n_landmarks = max(3, min(n_landmarks, MDS_MAX_LANDMARKS, n_rows))
+    rng = np.random.default_rng(42)
+    landmark_idx = np.sort(rng.choice(n_rows, size=n_landmarks, replace=False))
+    landmarks = scaled_data[landmark_idx]
+
+    # Classical MDS on the landmarks
+    from scipy.spatial.distance import pdist, squareform
+    landmark_sq_dist = squareform(pdist(landmarks, metric='sqeuclidean'))
+    centering = np.eye(n_landmarks) - np.full((n_landmarks, n_landmarks), 1.0 / n_landmarks)
+    gram = -0.5 * centering @ landmark_sq_dist @ centering
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    order = np.argsort(eigenvalues)[::-1][:2]
+    eigenvalues = np.clip(eigenvalues[order], 1e-12, None)
+    eigenvectors = eigenvectors[:, order]
+
+    # Triangulate all points from their squared distances to the landmarks
+    pseudo_inverse = eigenvectors / np.sqrt(eigenvalues)
+    mean_sq_dist = landmark_sq_dist.mean(axis=0)
+    landmark_sq_norms = np.sum(landmarks ** 2, axis=1)
+    coords = np.empty((n_rows, 2))
+    for start in range(0, n_rows, MDS_CHUNK_ROWS):
+        chunk = scaled_data[start:start + MDS_CHUNK_ROWS]
+        sq_dist = (np.sum(chunk ** 2, axis=1)[:, None] + landmark_sq_norms[None, :]
+                   - 2.0 * chunk @ landmarks.T)
+        coords[start:start + MDS_CHUNK_ROWS] = -0.5 * (sq_dist - mean_sq_dist) @ pseudo_inverse
+    return coords
+
+
+def _sampled_stress(scaled_data, coords, sample_size=MDS_STRESS_SAMPLE):
+    # Kruskal stress-1 between original and embedded distances, estimated on a
+    # fixed random sample of rows so it is comparable across methods
+    n_rows = len(scaled_data)
+    idx = np.arange(n_rows)
+    if n_rows > sample_size:
+        idx = np.sort(np.random.default_rng(42).choice(n_rows, size=sample_size, replace=False))
+    from scipy.spatial.distance import pdist
+    original = pdist(scaled_data[idx])
+    embedded = pdist(coords[idx])
+    denominator = np.sum(original ** 2)
+    if denominator == 0:
+        return 0.0
+    return float(np.sqrt(np.sum((original - embedded) ** 2) / denominator))
+
+
+def get_data_mds(method="auto", landmarks=None):
+    """
+    Returns the 2D MDS embedding of the standardized data points, cached per
+    dataset version and method.
+
+    Args:
+        method (str): "smacof", "classical", "landmark" or "auto" (SMACOF up to
+            MDS_SMACOF_MAX_ROWS rows, classical above that). SMACOF asked for
+            on more rows falls back to landmark MDS.
+        landmarks (int, optional): Number of landmarks for landmark MDS, at
+            most MDS_MAX_LANDMARKS
+
+    Returns:
+        dict: coords (n x 2 array), the method actually used and its stress
+    """
+    if method not in MDS_METHODS:
+        raise InvalidParameter(f"Unknown MDS method '{method}', expected one of {MDS_METHODS}")
+
+    dataset = load_merged_dataset()
+    scaled_data = _in_memory(dataset)["scaled"]
+    if method == "auto":
+        method = "smacof" if len(scaled_data) <= MDS_SMACOF_MAX_ROWS else "classical"
+    elif method == "smacof" and len(scaled_data) > MDS_SMACOF_MAX_ROWS:
+        # The dense n x n distance matrix is what the other methods exist to avoid
+        method = "landmark"
+    if method != "landmark":
+        landmarks = None
+    else:
+        landmarks = max(3, min(landmarks or MDS_LANDMARKS, MDS_MAX_LANDMARKS, len(scaled_data)))
+
+    def compute():
+        if method == "smacof":
+            coords = _smacof_mds(scaled_data)
+        elif method == "classical":
+            coords = _classical_mds()
+        else:
+            coords = _landmark_mds(scaled_data, landmarks)
+        return {
+            "coords": coords,
+            "method": method,
+            "landmarks": landmarks,
+            "stress": _sampled_stress(scaled_data, coords)
+        }
+
+    return dataset.memoize(("mds", method, landmarks), compute)
+
+
+def _score_cluster_candidate(data_coords, k, sample_size):
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(data_coords)  # Cluster in MDS space
+
+    # Skip if there's only one cluster or some clusters are empty
+    if len(np.unique(labels)) < 2:
+        return -1, labels
+
+    # Silhouette is O(n^2), so large inputs are scored on a fixed random sample
+    if len(data_coords) > sample_size:
+        return silhouette_score(data_coords, labels, sample_size=sample_size, random_state=42), labels
+    return silhouette_score(data_coords, labels), labels
+
+
+def find_optimal_clusters(method="auto", landmarks=None, sample_size=None):
+    """
+    Picks the number of clusters in MDS space with the highest silhouette
+    score. Candidates are evaluated in parallel and the winner is cached per
+    dataset version, MDS method and sample size.
+
+    Args:
+        method (str): MDS method passed to get_data_mds
+        landmarks (int, optional): Number of landmarks for landmark MDS
+        sample_size (int, optional): Rows used to estimate each silhouette
+            score (defaults to SILHOUETTE_SAMPLE_SIZE; smaller inputs are exact)
+
+    Returns:
+        dict: The optimal k, its cluster labels and the score of every candidate
+
+    Raises:
+        InvalidParameter: when sample_size is below SILHOUETTE_MIN_SAMPLE
+    """
+    if sample_size is None:
+        sample_size = SILHOUETTE_SAMPLE_SIZE
+    _check_range("silhouette_sample", sample_size, SILHOUETTE_MIN_SAMPLE)
+
+    dataset = load_merged_dataset()
+    data_mds = get_data_mds(method, landmarks)
+    data_coords = data_mds["coords"]
+
+    def compute():
+        from joblib import Parallel, delayed
+        candidates = Parallel(n_jobs=KMEANS_N_JOBS, prefer="threads")(
+            delayed(metrics.bind(_score_cluster_candidate))(data_coords, k, sample_size) for k in OPTIMAL_K_RANGE
+        )
+        scores = [float(score) for score, _ in candidates]
+        best = int(np.argmax(scores))
+        return {
+            "k": OPTIMAL_K_RANGE[best],
+            "labels": candidates[best][1],
+            "scores": dict(zip(OPTIMAL_K_RANGE, scores))
+        }
+
+    return dataset.memoize(("optimal_k", data_mds["method"], data_mds["landmarks"], sample_size), compute)
+
+
+def compute_mds_json(cluster_labels=None, find_optimal=False, method="auto", landmarks=None, silhouette_sample=None):
     """
     Computes MDS plots for data points and variables.
     
     Parameters:
     cluster_labels (pd.Series or list, optional): Cluster labels for coloring points.
     find_optimal (bool): Whether to find the optimal number of clusters (defaults to False).
+    method (str): MDS algorithm for the data points: "auto", "smacof", "classical" or "landmark".
+    landmarks (int, optional): Number of landmarks when method is "landmark".
+    silhouette_sample (int, optional): Rows sampled per silhouette score when finding the optimal k.
     
     Returns:
-    dict: A dictionary containing MDS coordinates for data points and variables in JSON format.
+    dict: A dictionary containing MDS coordinates for data points and variables.
     """
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    df = pd.read_csv(merged_df_path)
-    
-    # Select numeric columns only
-    df = df.select_dtypes(include=[np.number])
-    
-    # Dropping any columns with NaN values
-    df = df.dropna(axis=1)
-    
-    # Standardize the data
-    scaler = StandardScaler()
-    df_scaled = scaler.fit_transform(df)
+    # Numeric columns without NaNs, already standardized by the dataset store
+    dataset = _in_memory(load_merged_dataset())
+    df = dataset["numeric"]
     
     # (a) Data MDS plot using Euclidean distance
-    data_dist = squareform(pdist(df_scaled, metric='euclidean'))
-    mds_data = MDS(n_components=2, dissimilarity='precomputed', random_state=42)
-    data_coords = mds_data.fit_transform(data_dist)
+    data_mds = get_data_mds(method, landmarks)
+    data_coords = data_mds["coords"]
     
     # Determine optimal number of clusters if requested
     optimal_k = None
     if find_optimal:
-        # Calculate silhouette scores for different k values
-        
-        silhouette_scores = []
-        k_range = range(2, 11)  # Test 2-10 clusters
-        
-        for k in k_range:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(data_coords)  # Cluster in MDS space
-            
-            # Skip if there's only one cluster or some clusters are empty
-            if len(np.unique(labels)) < 2:
-                silhouette_scores.append(-1)
-                continue
-                
-            # Calculate silhouette score
-            score = silhouette_score(data_coords, labels)
-            silhouette_scores.append(score)
-        
-        # Find k with highest silhouette score
-        if silhouette_scores:
-            optimal_k = k_range[np.argmax(silhouette_scores)]
-            
-            # Use the optimal number of clusters
-            kmeans = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-            cluster_labels = kmeans.fit_predict(data_coords)
+        optimal = find_optimal_clusters(method, landmarks, silhouette_sample)
+        optimal_k = optimal["k"]
+        cluster_labels = optimal["labels"]
     
-    data_json = [{
-        "x": float(data_coords[i, 0]),
-        "y": float(data_coords[i, 1]),
-        "cluster": int(cluster_labels[i]) if cluster_labels is not None else None
-    } for i in range(len(df))]
+    # One {x, y, cluster} record per data point
+    data_json = pd.DataFrame({
+        "x": data_coords[:, 0],
+        "y": data_coords[:, 1],
+        "cluster": np.asarray(cluster_labels) if cluster_labels is not None else None
+    })
     
     # (b) Variable MDS plot using (1 - |correlation|) distance
     corr_matrix = df.corr().abs()  # Absolute correlation
     var_dist = 1 - corr_matrix
     var_dist[var_dist < 0] = 0  # Ensure non-negative distances
     
-    mds_var = MDS(n_components=2, dissimilarity='precomputed', random_state=42)
-    var_coords = mds_var.fit_transform(var_dist)
+    with metrics.span("variable_mds"):
+        from sklearn.manifold import MDS
+        mds_var = MDS(n_components=2, dissimilarity='precomputed', random_state=42)
+        var_coords = mds_var.fit_transform(var_dist)
     
-    var_json = [{
-        "x": float(var_coords[i, 0]),
-        "y": float(var_coords[i, 1]),
-        "variable": df.columns[i]
-    } for i in range(len(df.columns))]
+    var_json = pd.DataFrame({
+        "x": var_coords[:, 0],
+        "y": var_coords[:, 1],
+        "variable": df.columns
+    })
     
     result = {
         "data_mds": data_json, 
-        "variable_mds": var_json
+        "variable_mds": var_json,
+        "mds_method": data_mds["method"],
+        "stress": data_mds["stress"]
     }
     
     # Add optimal clustering info if available
     if find_optimal and optimal_k:
         result["optimal_k"] = optimal_k
         
-    return json.dumps(result, indent=4)
+    return result
 
 
-def compute_parallel_coordinates_json():
+def _encode_parallel_coordinates(df):
     """
-    Converts a dataframe into a format suitable for parallel coordinates plotting.
-    Handles both numerical and categorical variables.
-    
-    Returns:
-    dict: A dictionary with processed data and axis information
+    Column-wise encoding of merged_df for parallel coordinates: infinities
+    become +/-1e308, categorical columns are label encoded (NaN as 'missing',
+    codes in sorted order) and numerical axes get their min/max.
     """
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    merged_df_path = os.path.join(base_dir, "data", "merged_df.csv")
-    df = pd.read_csv(merged_df_path)
-
-    # Replace inf, -inf with large finite values and NaN with None
-    df = df.replace([np.inf, -np.inf], [1.0e+308, -1.0e+308])
     # Remove 'Name' column if it exists
     if 'Name' in df.columns:
         df = df.drop(columns=['Name', 'POS'])
-    
-    df_processed = df.copy()
-    encoders = {}
-    
-    # Create axis information for each column
+
+    columns = {}
     axes = []
+    encoders = {}
     for col in df.columns:
-        axis_info = {
-            "name": col,  # Original column name
-            "type": "categorical" if df[col].dtype == "object" or df[col].dtype == "category" else "numerical"
-        }
-        
-        # Add range information for numerical columns
-        if axis_info["type"] == "numerical":
-            axis_info["min"] = float(df[col].min()) if np.isfinite(df[col].min()) else None
-            axis_info["max"] = float(df[col].max()) if np.isfinite(df[col].max()) else None
-        
-        axes.append(axis_info)
-    
-    # Process categorical variables
-    for col in df.select_dtypes(include=['object', 'category']).columns:
-        encoder = LabelEncoder()
-        df_processed[col] = encoder.fit_transform(df[col].fillna('missing'))
-        # Convert NumPy values to native Python types
-        encoders[col] = {str(k): int(v) for k, v in zip(encoder.classes_, encoder.transform(encoder.classes_))}
-    
-    # Convert DataFrame to records and ensure all values are JSON serializable
-    records = []
-    for record in df_processed.to_dict(orient='records'):
-        # Convert any NumPy types to native Python types
-        clean_record = {}
-        for key, value in record.items():
-            if pd.isna(value):
-                clean_record[key] = None
-            elif isinstance(value, (np.integer, np.int64, np.int32)):
-                clean_record[key] = int(value)
-            elif isinstance(value, (np.floating, np.float64, np.float32)):
-                if np.isfinite(value):
-                    clean_record[key] = float(value)
-                else:
-                    clean_record[key] = None
-            elif isinstance(value, np.bool_):
-                clean_record[key] = bool(value)
-            elif isinstance(value, (np.ndarray, list)):
-                clean_record[key] = [
-                    None if pd.isna(x) else
-                    int(x) if isinstance(x, np.integer) else 
-                    float(x) if isinstance(x, np.floating) and np.isfinite(x) else
-                    bool(x) if isinstance(x, np.bool_) else x 
-                    for x in value
-                ]
-            else:
-                clean_record[key] = value
-        records.append(clean_record)
-    
+        values = df[col]
+        if values.dtype == "object" or values.dtype == "category":
+            codes, classes = pd.factorize(values.astype(object).fillna('missing'), sort=True)
+            columns[col] = codes.astype(np.int64)
+            encoders[col] = {str(k): i for i, k in enumerate(classes)}
+            axes.append({"name": col, "type": "categorical"})
+            continue
+
+        column = values.to_numpy()
+        if column.dtype.kind == "f":
+            # Replace inf, -inf with large finite values; NaN stays NaN (null)
+            column = np.where(np.isposinf(column), 1.0e+308, np.where(np.isneginf(column), -1.0e+308, column))
+            values = pd.Series(column)
+        columns[col] = column
+        col_min, col_max = values.min(), values.max()
+        axes.append({
+            "name": col,
+            "type": "numerical",
+            "min": float(col_min) if np.isfinite(col_min) else None,
+            "max": float(col_max) if np.isfinite(col_max) else None
+        })
+
     return {
-        "records": records,
+        "records": pd.DataFrame(columns, index=df.index),
         "axes": axes,
         "encoders": encoders
     }
 
-def get_crime_data_by_hour():
+
+def _bin_axis(column, axis, bins):
     """
-    Loads and processes the NYC crime data by hour, including borough information.
-    Returns data formatted for the stacked area chart.
+    Bin index of every row on one axis (-1 for missing values) and the bin
+    description: category codes for categorical axes, equal-width bins between
+    the axis min and max for numerical ones.
+    """
+    if axis["type"] == "categorical":
+        return column, {"bins": int(column.max()) + 1 if len(column) else 0}
+
+    values = np.asarray(column, dtype=float)
+    missing = np.isnan(values)
+    if axis["min"] is None or axis["max"] is None:
+        return np.full(len(values), -1, dtype=np.int64), {"bins": 0, "edges": []}
+
+    n_bins = bins if axis["max"] > axis["min"] else 1
+    edges = np.linspace(axis["min"], axis["max"], n_bins + 1)
+    codes = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+    codes[missing] = -1
+    return codes.astype(np.int64), {"bins": n_bins, "edges": edges}
+
+
+def _stratified_sample(strata, sample_size, seed=0):
+    """
+    Row indices of a sample of about sample_size rows, drawn without
+    replacement from every stratum in proportion to its size (largest
+    remainders get the leftover rows, and every stratum keeps at least one).
+    """
+    n_rows = len(strata)
+    if sample_size >= n_rows:
+        return np.arange(n_rows)
+
+    _, inverse = np.unique(strata, return_inverse=True)
+    counts = np.bincount(inverse)
+    share = counts * sample_size / n_rows
+    quota = np.floor(share).astype(np.int64)
+    leftover = sample_size - quota.sum()
+    if leftover > 0:
+        quota[np.argsort(quota - share, kind="stable")[:leftover]] += 1
+    quota = np.minimum(np.maximum(quota, 1), counts)
+
+    # Rank the rows of each stratum in random order and keep the first quota
+    rng = np.random.default_rng(seed)
+    permutation = rng.permutation(n_rows)
+    groups = inverse[permutation]
+    order = np.argsort(groups, kind="stable")
+    ranks = np.empty(n_rows, dtype=np.int64)
+    ranks[order] = np.arange(n_rows) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.sort(permutation[ranks < quota[groups]])
+
+
+def _parallel_coordinates_histograms(encoded, bins, pairs):
+    # Per-axis histograms and binned line densities between pairs of axes
+    records = encoded["records"]
+    axes = encoded["axes"]
+    binned = [_bin_axis(records[axis["name"]].to_numpy(), axis, bins) for axis in axes]
+
+    histograms = []
+    for axis, (codes, info) in zip(axes, binned):
+        valid = codes >= 0
+        histogram = {
+            "name": axis["name"],
+            "counts": np.bincount(codes[valid], minlength=info["bins"]),
+            "missing": int((~valid).sum())
+        }
+        if "edges" in info:
+            histogram["edges"] = info["edges"]
+        histograms.append(histogram)
+
+    if pairs == "all":
+        pair_indices = [(i, j) for i in range(len(axes)) for j in range(i + 1, len(axes))]
+    else:
+        pair_indices = [(i, i + 1) for i in range(len(axes) - 1)]
+
+    densities = []
+    for i, j in pair_indices:
+        (source, source_info), (target, target_info) = binned[i], binned[j]
+        valid = (source >= 0) & (target >= 0)
+        flat = source[valid] * target_info["bins"] + target[valid]
+        counts = np.bincount(flat, minlength=source_info["bins"] * target_info["bins"])
+        densities.append({
+            "source": axes[i]["name"],
+            "target": axes[j]["name"],
+            "counts": counts.reshape(source_info["bins"], target_info["bins"])
+        })
+
+    return {
+        "mode": "histogram",
+        "rowCount": len(records),
+        "axes": axes,
+        "encoders": encoded["encoders"],
+        "histograms": histograms,
+        "pairs": densities
+    }
+
+
+def compute_parallel_coordinates_json(mode="rows", sample_size=None, stratify=None, bins=20, pairs="adjacent"):
+    """
+    Converts a dataframe into a format suitable for parallel coordinates plotting.
+    Handles both numerical and categorical variables.
+
+    Args:
+        mode (str): "rows" returns every row, "sample" a stratified sample of
+            sample_size rows and "histogram" per-axis histograms plus binned
+            line densities between axes instead of rows
+        sample_size (int): Rows returned by the "sample" mode (default
+            PCP_SAMPLE_SIZE)
+        stratify (str): Axis whose categories (or bins) the sample keeps in
+            proportion; defaults to the first categorical axis
+        bins (int): Bins per numerical axis in the "histogram" mode and for
+            stratifying on a numerical axis
+        pairs (str): "adjacent" axis pairs or "all" pairs for the densities
+
+    Returns:
+    dict: A dictionary with processed data and axis information
+
+    Raises:
+        InvalidParameter: for an unknown mode, pairs or stratify axis, or an
+            out-of-range sample_size or bins
+    """
+    _check_choice("mode", mode, ("rows", "sample", "histogram"))
+    if sample_size is not None:
+        _check_range("sample_size", sample_size, 1)
+    _check_range("bins", bins, 1, PCP_MAX_BINS)
+    _check_choice("pairs", pairs, ("adjacent", "all"))
+    dataset = load_merged_dataset()
+    encoded = dataset.memoize(("pcp",), lambda: _encode_parallel_coordinates(_in_memory(dataset)["raw"]))
+
+    if mode == "histogram":
+        return dataset.memoize(
+            ("pcp", mode, bins, pairs), lambda: _parallel_coordinates_histograms(encoded, bins, pairs)
+        )
+
+    if mode == "sample":
+        axes = encoded["axes"]
+        if stratify is None:
+            stratify = next((axis["name"] for axis in axes if axis["type"] == "categorical"), None)
+        axis = next((axis for axis in axes if axis["name"] == stratify), None)
+        if axis is None:
+            if stratify is not None:
+                names = [axis["name"] for axis in axes]
+                raise InvalidParameter(f"Unknown axis '{stratify}' to stratify on, expected one of {names}")
+            strata = np.zeros(len(encoded["records"]), dtype=np.int64)
+        else:
+            strata, _ = _bin_axis(encoded["records"][stratify].to_numpy(), axis, bins)
+
+        rows = _stratified_sample(strata, sample_size or PCP_SAMPLE_SIZE)
+        return {
+            "mode": "sample",
+            "rowCount": len(encoded["records"]),
+            "sampleSize": len(rows),
+            "stratify": stratify,
+            "records": encoded["records"].iloc[rows],
+            "axes": axes,
+            "encoders": encoded["encoders"]
+        }
+
+    return encoded
+
+def _load_crime_cube(crime_data_path):
+    """
+    Parses nyc_crime_by_hour.csv into a dense borough x crime_type x hour
+    array of incident counts, with the boroughs and crime types integer-coded
+    in sorted order.
     """
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    # Assuming the original CSV 'nyc_crime_data_cleaned.csv' contains borough, crime_type, hour_of_day, incident_count
-    # If not, the source CSV needs to be checked and potentially replaced/modified.
-    # For now, let's assume 'nyc_crime_by_hour.csv' might be a pre-aggregated one.
-    # Let's try to use a more granular dataset if available or adjust.
-    # For the purpose of this fix, we will assume 'nyc_crime_by_hour.csv' *does* have borough.
-    # If it doesn't, this function would need to read from a more raw data source.
-    
-    crime_data_path = os.path.join(base_dir, "data", "nyc_crime_by_hour.csv") # This might need to change if this CSV is already too aggregated
-    
-    # Read the CSV file
     df = pd.read_csv(crime_data_path)
 
     # Ensure required columns exist (initial check for presence)
@@ -538,8 +1235,8 @@ def get_crime_data_by_hour():
         if 'crime_type' in df.columns and 'hour_of_day' in df.columns and 'incident_count' in df.columns:
             print("Falling back to grouping by crime_type only due to missing 'borough' column.")
             grouped_data = df.groupby(['crime_type', 'hour_of_day'])['incident_count'].sum().reset_index()
-            return grouped_data.to_dict('records')
-        return [] # Or raise an error
+            return {"fallback": grouped_data.to_dict('records')}
+        return {"fallback": []}
 
     # Replace string versions of null with np.nan in 'borough' column
     null_string_values = ['(null)', 'NULL', 'Null', 'nan', 'NaN', ''] # Add empty string if that represents null
@@ -553,69 +1250,190 @@ def get_crime_data_by_hour():
     if not all(col in df.columns for col in required_cols):
         # This implies some other required column might be missing
         print(f"Error: One or more required columns ({required_cols}) are still missing after initial checks and borough processing in {crime_data_path}")
-        return []
+        return {"fallback": []}
 
-    # Optional: Fill NaN in 'incident_count' with 0 if that makes sense for the dataset
-    # df['incident_count'].fillna(0, inplace=True)
+    borough_codes, boroughs = pd.factorize(df['borough'], sort=True)
+    type_codes, crime_types = pd.factorize(df['crime_type'], sort=True)
+    hours = df['hour_of_day'].to_numpy(dtype=np.int64)
+    n_hours = max(24, int(hours.max()) + 1 if len(hours) else 24)
+
+    cube = np.zeros((len(boroughs), len(crime_types), n_hours), dtype=np.int64)
+    np.add.at(cube, (borough_codes, type_codes, hours), df['incident_count'].fillna(0).to_numpy(dtype=np.int64))
+
+    return {
+        "cube": cube,
+        "boroughs": boroughs.tolist(),
+        "crimeTypes": crime_types.tolist(),
+        "boroughIndex": {name.upper(): i for i, name in enumerate(boroughs)},
+        "crimeTypeIndex": {name.upper(): i for i, name in enumerate(crime_types)}
+    }
+
+
+def _select_codes(names, index):
+    # Case-insensitive lookup; unknown names are ignored
+    if not names:
+        return np.arange(len(index))
+    return np.array(sorted({index[name.upper()] for name in names if name.upper() in index}), dtype=np.int64)
 
-    # Select and rename columns if necessary to match frontend expectations if they differ.
-    crime_data_records = df[['borough', 'crime_type', 'hour_of_day', 'incident_count']].to_dict('records')
-    
-    return crime_data_records
 
-def get_sunburst_data():
+def _crime_series(names, values):
+    return [{"name": name, "values": row} for name, row in zip(names, values)]
+
+
+def get_crime_data_by_hour(boroughs=None, crime_types=None, hour_min=0, hour_max=23, rollup=None, top_k=5):
     """
-    Loads and processes the restaurant data for a sunburst visualization.
-    Returns data formatted for D3.js sunburst chart.
+    Loads and processes the NYC crime data by hour, including borough information.
+    Returns data formatted for the stacked area chart.
+
+    Queries are answered by slicing and summing a cached borough x crime_type x
+    hour cube, so their cost does not depend on the number of CSV rows.
+
+    Args:
+        boroughs (list, optional): Boroughs to keep (case-insensitive, defaults to all)
+        crime_types (list, optional): Crime types to keep (defaults to all)
+        hour_min (int): First hour of day to keep
+        hour_max (int): Last hour of day to keep
+        rollup (str, optional): None for borough/crime_type/hour records, or
+            "borough", "crime_type", "top_types" (top_k types plus OTHER) or
+            "total" for one hourly series per group
+        top_k (int): Number of crime types kept by the "top_types" rollup
+
+    Returns:
+        list or dict: Records, or {"rollup", "hours", "series", "total"} for a rollup
+
+    Raises:
+        InvalidParameter: for an hour outside 0..23, a top_k below 1 or an unknown rollup
     """
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    sunburst_data_path = os.path.join(base_dir, "data", "sunburst_df.csv")
-    
-    # Read the CSV file
-    df = pd.read_csv(sunburst_data_path)
-    
-    # Create a hierarchical structure for the sunburst chart
+    _check_range("hour_min", hour_min, 0, 23)
+    _check_range("hour_max", hour_max, 0, 23)
+    _check_range("top_k", top_k, 1)
+    dataset = get_dataset(CRIME_DATA_PATH, _load_crime_cube)
+    crime = dataset.data
+    if "fallback" in crime:
+        return crime["fallback"]
+
+    cube = crime["cube"]
+    borough_idx = _select_codes(boroughs, crime["boroughIndex"])
+    type_idx = _select_codes(crime_types, crime["crimeTypeIndex"])
+    hour_idx = np.arange(max(hour_min, 0), min(hour_max, cube.shape[2] - 1) + 1)
+    selected = cube[np.ix_(borough_idx, type_idx, hour_idx)]
+
+    borough_names = [crime["boroughs"][i] for i in borough_idx]
+    type_names = [crime["crimeTypes"][i] for i in type_idx]
+
+    if rollup is None:
+        # One record per non-empty (borough, crime_type, hour) cell
+        b, t, h = np.nonzero(selected)
+        return pd.DataFrame({
+            "borough": np.asarray(borough_names, dtype=object)[b],
+            "crime_type": np.asarray(type_names, dtype=object)[t],
+            "hour_of_day": hour_idx[h],
+            "incident_count": selected[b, t, h]
+        })
+
+    if rollup == "borough":
+        series = _crime_series(borough_names, selected.sum(axis=1))
+    elif rollup == "crime_type":
+        series = _crime_series(type_names, selected.sum(axis=0))
+    elif rollup == "top_types":
+        by_type = selected.sum(axis=0)
+        top = np.argsort(by_type.sum(axis=1), kind='stable')[::-1][:top_k]
+        series = _crime_series([type_names[i] for i in top], by_type[top])
+        rest = np.setdiff1d(np.arange(len(type_names)), top)
+        if len(rest):
+            series.append({"name": "OTHER", "values": by_type[rest].sum(axis=0)})
+    elif rollup == "total":
+        series = [{"name": "ALL", "values": selected.sum(axis=(0, 1))}]
+    else:
+        raise InvalidParameter(f"Unknown crime rollup '{rollup}'")
+
+    return {
+        "rollup": rollup,
+        "hours": hour_idx,
+        "series": series,
+        "total": int(selected.sum())
+    }
+
+def _build_sunburst_tree(df, depth, top_n):
+    # Group ids follow the first appearance of each (borough, cuisine) pair, so
+    # boroughs, cuisines and restaurants keep the order of the CSV rows
+    group_ids = df.groupby(['borough', 'reduced_cuisine'], sort=False, dropna=False).ngroup().to_numpy()
+    ratings = df['rating'].to_numpy(dtype=float)
+    if top_n is None:
+        order = np.argsort(group_ids, kind='stable')
+    else:
+        # Best rated first within each cuisine; ties keep CSV order
+        order = np.lexsort((-ratings, group_ids))
+
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+
+    borough_names = df['borough'].to_numpy()[order]
+    cuisine_names = df['reduced_cuisine'].to_numpy()[order]
+    restaurant_names = df['name'].to_numpy()[order].tolist()
+    restaurant_ratings = ratings[order].tolist()
+
     data = {"name": "NYC Restaurants", "children": []}
-    
-    # Group by borough
-    boroughs = df['borough'].unique()
-    
-    for borough in boroughs:
-        borough_data = {"name": borough, "children": []}
-        borough_df = df[df['borough'] == borough]
-        
-        # Group by reduced cuisine type
-        cuisine_groups = borough_df['reduced_cuisine'].unique()
-        
-        for cuisine in cuisine_groups:
-            cuisine_data = {"name": cuisine, "children": []}
-            cuisine_df = borough_df[borough_df['reduced_cuisine'] == cuisine]
-            
-            # Add restaurant names
-            for _, row in cuisine_df.iterrows():
-                restaurant = {
-                    "name": row['name'],
-                    "value": 1,
-                    "rating": float(row['rating'])
-                }
-                cuisine_data["children"].append(restaurant)
-            
-            borough_data["children"].append(cuisine_data)
-        
-        data["children"].append(borough_data)
-    
+    boroughs = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        borough = borough_names[start]
+        if borough not in boroughs:
+            boroughs[borough] = {"name": borough, "children": []} if depth > 1 else {"name": borough, "value": 0}
+            data["children"].append(boroughs[borough])
+        borough_data = boroughs[borough]
+
+        if depth == 1:
+            borough_data["value"] += end - start
+            continue
+        if depth == 2:
+            borough_data["children"].append({"name": cuisine_names[start], "value": end - start})
+            continue
+
+        kept_end = end if top_n is None else min(end, start + top_n)
+        children = [
+            {"name": name, "value": 1, "rating": rating}
+            for name, rating in zip(restaurant_names[start:kept_end], restaurant_ratings[start:kept_end])
+        ]
+        if kept_end < end:
+            # Fold the remaining restaurants into a single node
+            children.append({
+                "name": "Other",
+                "value": end - kept_end,
+                "rating": round(float(np.mean(restaurant_ratings[kept_end:end])), 2)
+            })
+        borough_data["children"].append({"name": cuisine_names[start], "children": children})
+
     return data
 
-def get_nta_geojson():
+
+def get_sunburst_data(depth=3, top_n=None):
     """
-    Loads and returns the NTA (Neighborhood Tabulation Areas) GeoJSON data.
-    Returns data formatted for D3.js geo visualization.
+    Loads and processes the restaurant data for a sunburst visualization.
+    Returns data formatted for D3.js sunburst chart.
+
+    Args:
+        depth (int): Levels below the root: 1 boroughs, 2 cuisines, 3 restaurants
+        top_n (int, optional): Restaurants kept per cuisine, best rated first;
+            the rest are folded into an "Other" node
+
+    Returns:
+        dict: Borough -> cuisine -> restaurant tree, cached per file version
+
+    Raises:
+        InvalidParameter: when depth is outside 1..SUNBURST_MAX_DEPTH or top_n is below 1
+    """
+    _check_range("depth", depth, 1, SUNBURST_MAX_DEPTH)
+    if top_n is not None:
+        _check_range("top_n", top_n, 1)
+    dataset = get_dataset(SUNBURST_DF_PATH, pd.read_csv)
+    return dataset.memoize(("sunburst", depth, top_n), lambda: _build_sunburst_tree(dataset.data, depth, top_n))
+
+def _load_nta_geojson(nta_geojson_path):
+    """
+    Loads the NTA (Neighborhood Tabulation Areas) GeoJSON file and validates
+    and patches its features. Runs once per file version.
     """
-    # Get the base directory and construct absolute paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    nta_geojson_path = os.path.join(base_dir, "data", "NTA.geo.json")
-    
     try:
         with open(nta_geojson_path, 'r') as f:
             geojson_data = json.load(f)
@@ -684,12 +1502,100 @@ def get_nta_geojson():
             
         print(f"Successfully loaded GeoJSON with {len(valid_features)} valid features out of {feature_count_before} total features")
         return geojson_data
-    except FileNotFoundError:
-        print(f"Error: GeoJSON file not found at {nta_geojson_path}")
-        return {"error": "GeoJSON file not found", "type": "FeatureCollection", "features": []}
     except json.JSONDecodeError as e:
         print(f"Error parsing GeoJSON: {e}")
         return {"error": f"JSON parsing error: {str(e)}", "type": "FeatureCollection", "features": []}
     except Exception as e:
         print(f"Error loading NTA GeoJSON data: {e}")
-        return {"error": f"Unknown error: {str(e)}", "type": "FeatureCollection", "features": []}
\ No newline at end of file
+        return {"error": f"Unknown error: {str(e)}", "type": "FeatureCollection", "features": []}
+
+
+def _load_borough_geojson(borough_geojson_path):
+    try:
+        with open(borough_geojson_path, 'r') as f:
+            geojson_data = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error parsing GeoJSON: {e}")
+        return {"error": f"JSON parsing error: {str(e)}", "type": "FeatureCollection", "features": []}
+
+    if not isinstance(geojson_data, dict) or not isinstance(geojson_data.get('features'), list):
+        print("Error: Invalid GeoJSON structure")
+        return {"error": "Invalid GeoJSON structure", "type": "FeatureCollection", "features": []}
+
+    # Keep only features with polygon geometry
+    geojson_data['features'] = [
+        feature for feature in geojson_data['features']
+        if feature.get('geometry') and feature['geometry'].get('type') in ('Polygon', 'MultiPolygon')
+        and feature['geometry'].get('coordinates')
+    ]
+    geojson_data.pop('crs', None)
+    return geojson_data
+
+
+def select_geo_level(level=None, tolerance=None, zoom=None):
+    """
+    Picks a precomputed simplification level: an explicit level wins, then a
+    tolerance in degrees, then a web-map zoom (tolerance of one 256px tile
+    pixel). Returns the coarsest level whose tolerance is not above the target.
+    """
+    if level is not None:
+        return min(max(level, 0), len(GEO_LEVEL_TOLERANCES) - 1)
+    if zoom is not None:
+        tolerance = 360.0 / (256 * 2 ** zoom)
+    if tolerance is None:
+        return 0
+    return max(i for i, level_tolerance in enumerate(GEO_LEVEL_TOLERANCES) if level_tolerance <= tolerance)
+
+
+def _geo_collection(dataset, level, geo_format, object_name):
+    collection = dataset.data
+    if 'error' in collection or not collection['features']:
+        return collection
+    if level == 0 and geo_format == "geojson":
+        return collection
+
+    features = collection['features']
+    topology = dataset.memoize("topology", lambda: geo.build_topology(features))
+    arcs = dataset.memoize(("arcs", level), lambda: geo.simplify_topology(topology, GEO_LEVEL_TOLERANCES[level]))
+    if geo_format == "topojson":
+        return dataset.memoize(("topojson", level), lambda: geo.to_topojson(features, topology, arcs, object_name))
+    return dataset.memoize(("geojson", level), lambda: geo.to_geojson(features, topology, arcs))
+
+
+def _get_geojson(path, loader, level, geo_format, object_name):
+    if geo_format not in ("geojson", "topojson"):
+        raise InvalidParameter(f"Unknown geometry format '{geo_format}'")
+    try:
+        dataset = get_dataset(path, loader)
+    except FileNotFoundError:
+        print(f"Error: GeoJSON file not found at {path}")
+        return {"error": "GeoJSON file not found", "type": "FeatureCollection", "features": []}
+    return _geo_collection(dataset, level, geo_format, object_name)
+
+
+def get_nta_geojson(level=0, geo_format="geojson"):
+    """
+    Loads and returns the NTA (Neighborhood Tabulation Areas) GeoJSON data.
+    Returns data formatted for D3.js geo visualization.
+
+    Args:
+        level (int): Simplification level, 0 for full precision (see GEO_LEVEL_TOLERANCES)
+        geo_format (str): "geojson" or "topojson" (shared, quantized arcs)
+
+    Returns:
+        dict: FeatureCollection or Topology, built once per file version and level
+    """
+    return _get_geojson(NTA_GEOJSON_PATH, _load_nta_geojson, level, geo_format, "nta")
+
+
+def get_borough_geojson(level=0, geo_format="geojson"):
+    """Same as get_nta_geojson for the five borough boundaries."""
+    return _get_geojson(BOROUGH_GEOJSON_PATH, _load_borough_geojson, level, geo_format, "boroughs")
+
+
+def warm_geo_cache():
+    """Builds every geometry level and format up front (called at startup)."""
+    for get_geometry in (get_nta_geojson, get_borough_geojson):
+        for level in range(len(GEO_LEVEL_TOLERANCES)):
+            for geo_format in ("geojson", "topojson"):
+                get_geometry(level, geo_format)
@@ -0,0 +1,67 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+The first request for a key starts the computation; identical requests that
+arrive while it is running wait for the same result instead of starting
+their own copy. Nothing is kept once the computation finishes; caching
+finished results is the job of the dataset store.
+"""
+import asyncio
+
+import metrics
+
+STATS = {
+    "requests": 0,      # calls to coalesce()
+    "computations": 0,  # calls that started a computation
+    "coalesced": 0,     # calls that joined one already in flight
+    "waiting": 0,       # calls currently waiting on another call's computation
+    "maxWaiting": 0
+}
+
+_inflight = {}
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def request_key(endpoint, params, *extra):
+    """Builds a coalescing key from an endpoint and its normalized parameters."""
+    return (endpoint, _freeze(params)) + extra
+
+
+async def coalesce(key, factory):
+    """
+    Returns the result of factory() for key, sharing one computation between
+    every caller that asks for the same key while it is running.
+
+    The computation runs in its own task, so a caller disconnecting does not
+    cancel it for the others.
+    """
+    STATS["requests"] += 1
+    task = _inflight.get(key)
+    if task is None:
+        STATS["computations"] += 1
+        metrics.count("singleflight", "leader")
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    STATS["coalesced"] += 1
+    metrics.count("singleflight", "coalesced")
+    STATS["waiting"] += 1
+    STATS["maxWaiting"] = max(STATS["maxWaiting"], STATS["waiting"])
+    try:
+        return await asyncio.shield(task)
+    finally:
+        STATS["waiting"] -= 1
+
+
+def stats():
+    """Returns the coalescing counters plus the number of keys in flight."""
+    return dict(STATS, inFlight=len(_inflight))
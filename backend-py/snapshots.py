@@ -0,0 +1,121 @@
+"""
+On-disk snapshots of fitted models, shared by every worker process.
+
+A fresh worker would otherwise refit PCA, KMeans, MDS and the optimal-k
+search on its first requests. Instead, each memoized value of a snapshot
+kind is pickled to
+
+    precompute/snapshots/<dataset version>-<code version>/<kind>-<key hash>.pkl
+
+when it is first computed. A worker that misses its in-memory memo restores
+the value from there before fitting anything. The code version hashes the
+modules that fit the models, the sklearn version and the settings the fits
+depend on (services.response_settings), so snapshots written by other code or
+under other settings are never read. Files are written to a temporary name
+and renamed, so readers never see a partial snapshot, and a file that cannot
+be read is treated as missing.
+
+The scaler parameters are not snapshotted here: the matrix cache
+(matrixcache.py) already restores them together with the parsed matrices.
+
+Snapshots are pickles, so only point ANALYTICS_SNAPSHOT_DIR at a directory
+this service alone writes to.
+
+Configuration (environment variables):
+    ANALYTICS_SNAPSHOTS         "off" disables snapshots (default: on)
+    ANALYTICS_SNAPSHOT_DIR      where snapshots are written
+                                (default: precompute/snapshots)
+"""
+import functools
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from importlib.metadata import PackageNotFoundError, version as package_version
+
+import metrics
+from datastore import BASE_DIR
+
+ENABLED = os.environ.get("ANALYTICS_SNAPSHOTS", "on") != "off"
+SNAPSHOT_DIR = os.environ.get("ANALYTICS_SNAPSHOT_DIR", os.path.join(BASE_DIR, "precompute", "snapshots"))
+
+# Modules whose code decides what a snapshotted model contains
+_SOURCE_FILES = ("services.py", "outofcore.py")
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of the fitting code, the sklearn version and the settings the fits depend on."""
+    # Imported here because services imports this module
+    from services import response_settings
+
+    digest = hashlib.sha256()
+    for name in _SOURCE_FILES:
+        with open(os.path.join(BASE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    try:
+        digest.update(package_version("scikit-learn").encode("utf-8"))
+    except PackageNotFoundError:
+        pass
+    digest.update(json.dumps(response_settings(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Snapshot:
+    """Snapshot store for the memoized values of the given kinds (see Dataset.memoize)."""
+
+    def __init__(self, kinds):
+        self.kinds = frozenset(kinds)
+
+    def _path(self, version, key):
+        kind = key[0] if isinstance(key, tuple) else key
+        key_hash = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(SNAPSHOT_DIR, f"{version}-{code_version()}", f"{kind}-{key_hash}.pkl")
+
+    def covers(self, key):
+        return (key[0] if isinstance(key, tuple) else key) in self.kinds
+
+    def lookup(self, version, key):
+        """Returns (True, value) when a snapshot of key exists for this dataset version, else (False, None)."""
+        try:
+            with metrics.span("snapshot_restore"), open(self._path(version, key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            metrics.count("snapshot", False)
+            return False, None
+        except Exception as e:
+            print(f"Ignoring unreadable snapshot for {key}: {e}")
+            metrics.count("snapshot", False)
+            return False, None
+        metrics.count("snapshot", True)
+        return True, value
+
+    def store(self, version, key, value):
+        """Writes the snapshot of key; failures are logged and otherwise ignored."""
+        path = self._path(version, key)
+        tmp = f"{path}.tmp{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with metrics.span("snapshot_write"), open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"Could not write snapshot for {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def prune(keep_version):
+    """Removes the snapshots of every dataset version and code version other than the current ones."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    keep = f"{keep_version}-{code_version()}"
+    removed = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name != keep:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+            removed.append(name)
+    return removed
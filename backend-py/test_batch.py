@@ -0,0 +1,42 @@
+import json
+import os
+
+# Compute in-process and keep the test from writing fit snapshots
+os.environ.setdefault("ANALYTICS_PROCESS_WORKERS", "0")
+os.environ.setdefault("ANALYTICS_SNAPSHOTS", "off")
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def post_batch(client, views):
+    response = client.post("/batch", json={"views": views})
+    assert response.status_code == 200
+    return {line["id"]: line for line in map(json.loads, response.text.splitlines()) if "id" in line}
+
+
+def test_batch_rejects_out_of_range_params():
+    with TestClient(main.app) as client:
+        lines = post_batch(client, [
+            {"view": "sunburst_data", "id": "depth", "params": {"depth": 0}},
+            {"view": "scatterplot_matrix", "id": "bins", "params": {"mode": "binned", "bins": 4000}},
+            {"view": "pdp", "id": "pdp_bins", "params": {"mode": "histogram", "bins": 0}},
+            {"view": "crime_data", "id": "top_k", "params": {"rollup": "top_types", "top_k": 0}},
+            {"view": "kmeans", "id": "clusters", "params": {"clusters": 0}},
+            {"view": "top_features", "id": "dimensions", "params": {"dimensions": 0}}
+        ])
+
+    assert {line["type"] for line in lines.values()} == {"error"}
+    assert {line["status"] for line in lines.values()} == {422}
+    assert lines["depth"]["error"] == "depth must be between 1 and 3, got 0"
+    assert lines["bins"]["error"] == "bins must be between 2 and 512, got 4000"
+
+
+def test_batch_matches_route_bounds():
+    with TestClient(main.app) as client:
+        route = client.get("/sunburst_data", params={"depth": 0})
+        lines = post_batch(client, [{"view": "sunburst_data", "params": {"depth": 0}}])
+
+    assert route.status_code == 422
+    assert lines["sunburst_data"]["status"] == 422
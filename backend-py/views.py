@@ -0,0 +1,113 @@
+"""
+Payload builders for the API endpoints.
+
+Each view returns exactly the document its endpoint sends. Views are plain
+module-level functions of keyword arguments, so the compute executor can run
+them in a worker process and render the result there. Errors raised by
+views map to HTTP statuses through error_status, for the routes and /batch
+alike.
+"""
+from fastapi import HTTPException
+
+from services import InvalidParameter, UnsupportedInMode, get_pca_model, perform_pca, get_biplot_data, get_biplot_header, get_biplot_rows, top_features, get_scatterplot_matrix_data, get_pca_loadings, perform_kmeans, get_cluster_labels, compute_mds_json, compute_parallel_coordinates_json, get_crime_data_by_hour, get_sunburst_data, get_nta_geojson, get_borough_geojson
+
+
+# Service exceptions -> HTTP status of the response reporting them
+ERROR_STATUS = {InvalidParameter: 422, UnsupportedInMode: 501}
+
+
+def error_status(error):
+    """
+    Returns (status code, detail) to report for an exception raised by a
+    view. Unexpected errors get a generic 500 detail.
+    """
+    if isinstance(error, HTTPException):
+        return error.status_code, error.detail
+    for error_type, status in ERROR_STATUS.items():
+        if isinstance(error, error_type):
+            return status, str(error)
+    return 500, "Internal Server Error"
+
+
+def eigen_values_view():
+    result = perform_pca()
+    return {"explained_variance_ratio": result["explainedVarianceRatio"], "solver": result["solver"]}
+
+
+def biplot_view(dimensions=None):
+    # get_biplot_data handles the default dimensions
+    return {"biplot": get_biplot_data(dimensions)}
+
+
+def biplot_stream_header_view(dimensions=None, offset=0, limit=None):
+    return dict(get_biplot_header(dimensions, offset, limit), type="header")
+
+
+def biplot_rows_view(start, stop):
+    return dict(get_biplot_rows(start, stop), type="rows")
+
+
+def top_features_view(dimensions=2):
+    features = top_features(dimensions)
+    return {"top_features": features, "solver": get_pca_model(dimensions, scores=False)["solver"]}
+
+
+def scatterplot_matrix_view(dimensions=2, n_clusters=3, mode="points", bins=32, bin_shape="square"):
+    return {"scatterplot_matrix": get_scatterplot_matrix_data(dimensions, n_clusters, mode, bins, bin_shape)}
+
+
+def pca_loadings_view(dimensions=None):
+    return {"loadings": get_pca_loadings(dimensions)}
+
+
+def kmeans_view(clusters=3, dimensions=2):
+    return perform_kmeans(n_clusters=clusters, dimensions=dimensions)
+
+
+def mdp_view(clusters=3, find_optimal=True, method="auto", landmarks=None, silhouette_sample=None):
+    if find_optimal:
+        # If finding optimal clusters, run the MDS with optimization
+        return compute_mds_json(cluster_labels=None, find_optimal=True, method=method, landmarks=landmarks, silhouette_sample=silhouette_sample)
+
+    # Otherwise use the user-specified number of clusters
+    cluster_labels = get_cluster_labels(n_clusters=clusters)
+    return compute_mds_json(cluster_labels=cluster_labels, find_optimal=False, method=method, landmarks=landmarks)
+
+
+def pdp_view(mode="rows", sample_size=None, stratify=None, bins=20, pairs="adjacent"):
+    return compute_parallel_coordinates_json(mode, sample_size, stratify, bins, pairs)
+
+
+def crime_data_view(boroughs=None, crime_types=None, hour_min=0, hour_max=23, rollup=None, top_k=5):
+    return get_crime_data_by_hour(boroughs, crime_types, hour_min, hour_max, rollup, top_k)
+
+
+def sunburst_data_view(depth=3, top_n=None):
+    return get_sunburst_data(depth, top_n)
+
+
+def nta_geo_view(level=0, geo_format="geojson"):
+    try:
+        geojson_data = get_nta_geojson(level, geo_format)
+
+        # Check if there's an error or if the data is invalid
+        if isinstance(geojson_data, dict) and 'error' in geojson_data:
+            return geojson_data
+
+        if geo_format == "topojson":
+            return geojson_data
+
+        if not isinstance(geojson_data, dict) or 'type' not in geojson_data or 'features' not in geojson_data:
+            return {"error": "Invalid GeoJSON structure", "type": "FeatureCollection", "features": []}
+
+        if not geojson_data['features'] or len(geojson_data['features']) == 0:
+            return {"error": "No features found in GeoJSON", "type": "FeatureCollection", "features": []}
+
+        return geojson_data
+    except Exception as e:
+        print(f"Unexpected error in get_nta_geo_data endpoint: {str(e)}")
+        return {"error": f"Server error: {str(e)}", "type": "FeatureCollection", "features": []}
+
+
+def borough_geo_view(level=0, geo_format="geojson"):
+    return get_borough_geojson(level, geo_format)